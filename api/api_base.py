@@ -6,9 +6,12 @@ import json
 import logging
 import time
 import hashlib
-from flask import request, make_response
+from flask import request, make_response, Response, stream_with_context, g
 from flask_restful import Resource
 from utils.grasp_database import Database
+from utils.reference_data import ReferenceData
+from utils.history_writer import HistoryWriter
+from utils.metrics import Metrics
 from utils.user import User
 
 
@@ -39,25 +42,50 @@ class APIBase(Resource):
             if hasattr(attr, '__call__'):
                 def wrapped_function(*args, **kwargs):
                     start_time = time.time()
+                    method = name.upper()
+                    path = request.path
+                    route = Metrics.get_route()
+                    Metrics.start_request(route, method)
+
+                    def end_request(status_code, size=None, rows=None):
+                        end_time = time.time()
+                        self.logger.info('[%s] %s %.4fs %s',
+                                         method,
+                                         path,
+                                         end_time - start_time,
+                                         status_code)
+                        Metrics.end_request(route,
+                                            method,
+                                            status_code,
+                                            end_time - start_time,
+                                            size,
+                                            rows)
+
+                    status_code = 500
+                    size = None
+                    streamed = False
                     try:
                         result = attr(*args, **kwargs)
                         if isinstance(result, (list, dict)):
                             result = APIBase.build_response(result)
 
                         status_code = result.status_code
+                        if result.is_streamed:
+                            # Streamed request ends when the whole body was sent
+                            result.call_on_close(lambda: end_request(status_code))
+                            streamed = True
+                        else:
+                            # Size before compression, same as bodies that
+                            # are compressed by Flask-Compress later
+                            size = g.get('response_size', result.calculate_content_length())
                     except Exception:
-                        status_code = 500
                         self.logger.error(traceback.format_exc())
                         return {'response': None,
                                 'success': False,
                                 'message': 'Server error, please contact an administrator'}
                     finally:
-                        end_time = time.time()
-                        self.logger.info('[%s] %s %.4fs %s',
-                                         name.upper(),
-                                         request.path,
-                                         end_time - start_time,
-                                         status_code) #pylint: disable=used-before-assignment
+                        if not streamed:
+                            end_request(status_code, size, g.get('response_rows'))
                     return result
 
                 return wrapped_function
@@ -147,12 +175,96 @@ class APIBase(Resource):
 
         return ensure_request_data_wrapper
 
+    @classmethod
+    def with_etag(cls, collection_names):
+        """
+        Add a weak ETag made of request path, arguments, Accept header and
+        change generations of given collections to successful responses and
+        return 304 Not Modified if client already has the same ETag
+        """
+        def with_etag_wrapper(func):
+            """
+            Wrapper
+            """
+            def with_etag_wrapper_wrapper(*args, **kwargs):
+                """
+                Wrapper inside wrapper
+                """
+                generations = cls.get_generations(collection_names)
+                etag = json.dumps([request.full_path,
+                                   request.headers.get('Accept', ''),
+                                   generations])
+                etag = hashlib.sha256(etag.encode('utf-8')).hexdigest()
+                headers = {'Cache-Control': 'no-cache'}
+                if cls.etag_matches(etag):
+                    resp = cls.build_response('', code=304, headers=headers)
+                    resp.set_etag(etag, weak=True)
+                    return resp
+
+                result = func(*args, **kwargs)
+                if isinstance(result, dict):
+                    if not result.get('success'):
+                        return result
+
+                    result = cls.build_response(result)
+
+                if result.status_code == 200:
+                    result.headers.extend(headers)
+                    result.set_etag(etag, weak=True)
+
+                return result
+
+            with_etag_wrapper_wrapper.__name__ = func.__name__
+            with_etag_wrapper_wrapper.__doc__ = func.__doc__
+            with_etag_wrapper_wrapper.__func__ = func
+            if hasattr(func, '__role__'):
+                with_etag_wrapper_wrapper.__role__ = func.__role__
+
+            return with_etag_wrapper_wrapper
+
+        return with_etag_wrapper
+
+    @staticmethod
+    def get_generations(collection_names):
+        """
+        Return tuple of change generations of collections, they are read once
+        per request and cached names of changed collections are dropped
+        Generations must be read before the response is made, so a response
+        that might have missed a concurrent change gets older generations
+        """
+        collection_names = tuple(collection_names)
+        request_generations = g.setdefault('generations', {})
+        generations = request_generations.get(collection_names)
+        if generations is None:
+            generations = Database(collection_names[0]).get_generations(collection_names)
+            ReferenceData.check_generations(collection_names, generations)
+            request_generations[collection_names] = generations
+
+        return generations
+
+    @staticmethod
+    def etag_matches(etag):
+        """
+        Return whether If-None-Match header of the request has the ETag
+        Flask-Compress adds ":<algorithm>" to ETags of responses it compresses,
+        so the suffix is ignored
+        """
+        if_none_match = request.if_none_match
+        if if_none_match.star_tag:
+            return True
+
+        return any(value.split(':', 1)[0] == etag
+                   for value in if_none_match.as_set(include_weak=True))
+
     @staticmethod
     def build_response(data, code=200, headers=None, content_type='application/json'):
         """
         Makes a Flask response with a plain text encoded body
         """
-        if content_type == 'application/json':
+        if isinstance(data, dict) and isinstance(data.get('response'), list):
+            Metrics.set_rows(len(data['response']))
+
+        if content_type == 'application/json' and not isinstance(data, (str, bytes)):
             resp = make_response(json.dumps(data, indent=1, sort_keys=True), code)
         else:
             resp = make_response(data, code)
@@ -162,15 +274,46 @@ class APIBase(Resource):
         resp.headers['Access-Control-Allow-Origin'] = '*'
         return resp
 
+    @classmethod
+    def build_cached_response(cls, entry, content_type='application/json'):
+        """
+        Makes a Flask response from a (body, gzip compressed body, rows) tuple
+        Compressed body is used if client accepts gzip
+        """
+        body, compressed_body, rows = entry
+        if rows is not None:
+            Metrics.set_rows(rows)
+
+        Metrics.set_size(len(body))
+
+        if not request.accept_encodings['gzip']:
+            return cls.build_response(body, content_type=content_type)
+
+        return cls.build_response(compressed_body,
+                                  headers={'Content-Encoding': 'gzip',
+                                           'Vary': 'Accept-Encoding'},
+                                  content_type=content_type)
+
+    @staticmethod
+    def build_stream_response(chunks, code=200, content_type='application/json'):
+        """
+        Makes a Flask response with a chunked body from a generator of strings
+        Generator runs after the response was returned, so errors can no
+        longer change the status code and only cut the body short
+        """
+        resp = Response(stream_with_context(chunks), status=code, content_type=content_type)
+        resp.headers['Access-Control-Allow-Origin'] = '*'
+        return resp
+
     def add_history_entry(self, prepid, action, value):
         """
         Add entry to the history table
+        Entries are written in batches by a background thread
         """
-        history_db = Database('history')
         entry = {'time': int(time.time()),
                  'user': User().get_username(),
                  'prepid': prepid,
                  'action': action,
                  'value': value}
         entry['_id'] = hashlib.sha256(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
-        history_db.save(entry)
+        HistoryWriter.add(entry)
@@ -3,6 +3,7 @@ Module with all campaigns' APIs
 """
 from api.api_base import APIBase
 from utils.grasp_database import Database
+from utils.reference_data import ReferenceData
 from utils.user import Role
 from utils.utils import make_regex_matcher as regex
 
@@ -26,6 +27,8 @@ class CreateCampaignAPI(APIBase):
         campaign_db = Database('campaigns')
         campaign = {'_id': name, 'name': name}
         campaign_db.save(campaign)
+        campaign_db.bump_generation()
+        ReferenceData.invalidate('campaigns')
         self.add_history_entry('', 'create campaign', name)
         return {'response': campaign, 'success': True, 'message': ''}
 
@@ -34,14 +37,13 @@ class GetCampaignsAPI(APIBase):
     """
     Endpoint for getting list of campaign
     """
+    @APIBase.with_etag(['campaigns'])
     def get(self):
         """
         Get a single existing campaign with all entries inside
         """
         self.logger.info('Getting campaigns')
-        campaign_db = Database('campaigns')
-        campaigns = campaign_db.query(limit=campaign_db.get_count())
-        campaigns = [c['name'] for c in campaigns]
+        campaigns = list(ReferenceData.get_names('campaigns'))
         return {'response': campaigns, 'success': True, 'message': ''}
 
 
@@ -57,6 +59,8 @@ class DeleteCampaignAPI(APIBase):
         self.logger.info('Deleting campaign %s', campaign_name)
         campaign_db = Database('campaigns')
         campaign_db.delete_document({'_id': campaign_name})
+        campaign_db.bump_generation()
+        ReferenceData.invalidate('campaigns')
         # Entries from samples database should be deleted during next update
         self.add_history_entry('', 'delete campaign', campaign_name)
         return {'response': None, 'success': True, 'message': ''}
@@ -1,11 +1,21 @@
 """
 Module with all samples' APIs
 """
+import hashlib
+import json
+import os
+from collections import Counter
 import flask
+from cachelib import SimpleCache
 from api.api_base import APIBase
 from utils.grasp_database import Database
+from utils.response_cache import ResponseCache
+from utils.query_compiler import get_wildcard_regex, has_wildcard
+from utils.reference_data import ReferenceData
+from utils.table_format import to_columns, to_csv
 from utils.user import Role
-from utils.utils import clean_split, get_pwgs
+from utils.utils import (clean_split, get_pwgs, add_derived_fields, get_derived_version,
+                         parse_limit)
 
 
 class GetSamplesAPI(APIBase):
@@ -13,173 +23,96 @@ class GetSamplesAPI(APIBase):
     Endpoint for getting sample entries
     """
 
-    #pylint: disable=too-many-branches,too-many-statements
-    # It is ok to have many ifs in this function
-    def get_short_name(self, name):
-        """
-        Return short name of dataset name
-        """
-        spl = name.split('_')
-        short_name = spl[0]
-
-        if 'GluGluToH' in name or 'GluGluH' in name:
-            short_name = 'GluGluToH'
-        elif 'TTTo' in name:
-            short_name = 'TTbar'
-        elif 'GluGluToPseudoScalarH' in name:
-            short_name = 'GluGluToPseudoScalarH'
-        elif 'VBFHiggs' in name:
-            short_name = 'VBFHiggs'
-        elif 'ZHiggs' in name:
-            short_name = 'ZHiggs'
-        elif 'WHiggs' in name:
-            short_name = 'WHiggs'
-        elif 'GluGluToMaxmixH' in name:
-            short_name = 'GluGluToMaxmixH'
-        elif 'GluGluToContin' in name:
-            short_name = 'GluGluToContin'
-        elif 'DiPhotonJets' in name:
-            short_name = 'DiPhotonJets'
-        elif 'JJH' in name:
-            short_name = 'JJHiggs'
-        elif 'GluGluToBulkGraviton' in name:
-            short_name = 'GluGluToBulkGraviton'
-        elif 'BulkGraviton' in name:
-            short_name = 'BulkGraviton'
-        elif short_name == 'b':
-            short_name = 'bbbar4l'
-        elif short_name == 'ST':
-            short_name = 'SingleTop'
-        elif short_name == 'QCD' and 'Flat' in name and not 'herwig' in name:
-            short_name = 'Flat QCD P8'
-        elif short_name == 'QCD' and 'Flat' in name and 'herwig' in name:
-            short_name = 'Flat QCD H7'
-        elif short_name == 'QCD' and '_Pt_' in name:
-            short_name = 'QCD P8'
-
-        if 'madgraphMLM' in name:
-            short_name += ' LO MG+P8'
-        elif 'FxFx' in name or 'amcatnlo' in name:
-            short_name += ' NLO MG+P8'
-        elif 'powheg' in name and 'pythia8' in name:
-            short_name += ' NLO PH+P8'
-        elif 'sherpa' in name:
-            short_name += ' Sherpa'
-        elif 'madgraph' in name:
-            short_name += ' LO MG+P8'
-
-        if short_name.startswith('WW'):
-            short_name = short_name.replace('WW', 'VV', 1)
-        elif short_name.startswith('WZ'):
-            short_name = short_name.replace('WZ', 'VV', 1)
-        elif short_name.startswith('ZZ'):
-            short_name = short_name.replace('ZZ', 'VV', 1)
-        elif short_name.startswith('ZW'):
-            short_name = short_name.replace('ZW', 'VV', 1)
-
-        return short_name
-    #pylint: enable=too-many-branches,too-many-statements
-
-    def get_chain_tag(self, name):
-        """
-        Get chain tag out of chained request name
-        If there is something after DIGI, use that something
-        Else it is Classical
-        """
-        if name == '':
-            return ''
-
-        tag = ''
-        try:
-            if 'DIGI' in name:
-                tag = name.split('-')[1].split('DIGI')[1].split('_')[0]
-            elif 'DR' in name:
-                tag = name.split('-')[1].split('DR')[1].split('_')[0]
-
-            if tag:
-                return tag
-
-        except IndexError:
-            pass
-
-        return 'Classical'
-
+    # Stored attributes of samples that are returned to the user
+    SAMPLE_FIELDS = ['_id', 'campaign', 'chained_request', 'dataset',
+                     'short_name', 'chain_tag', 'miniaod_version', 'nanoaod_version',
+                     'root', 'root_priority', 'root_total_events', 'root_done_events',
+                     'root_status', 'root_output', 'root_processing_string',
+                     'miniaod', 'miniaod_priority', 'miniaod_total_events',
+                     'miniaod_done_events', 'miniaod_status', 'miniaod_output',
+                     'miniaod_processing_string',
+                     'nanoaod', 'nanoaod_priority', 'nanoaod_total_events',
+                     'nanoaod_done_events', 'nanoaod_status', 'nanoaod_output',
+                     'nanoaod_processing_string',
+                     'tags', 'pwgs']
+    # Attributes that are needed to sort and to recompute outdated derived ones,
+    # derived_version is internal and is not returned
+    REQUIRED_FIELDS = ['_id', 'chained_request', 'dataset', 'root', 'miniaod', 'nanoaod', 'tags',
+                       'short_name', 'derived_version']
+    # Largest number of samples returned at once
+    MAX_ROWS = 25000
+    # Number of exact dataset names of uploaded file looked up in one query
+    UPLOAD_CHUNK_SIZE = 1000
+    # Largest number of dataset names with wildcards in uploaded file
+    UPLOAD_MAX_PATTERNS = 100
+    # Attributes that samples are sorted by
+    SORT_FIELDS = ['short_name', 'dataset', 'root', 'miniaod', 'nanoaod']
+    # Streaming formats and their content types
+    STREAM_FORMATS = {'stream': 'application/json',
+                      'ndjson': 'application/x-ndjson'}
+    # Table formats and their content types
+    TABLE_FORMATS = {'columns': 'application/json',
+                     'csv': 'text/csv; charset=utf-8'}
+    # Number of rows serialized and sent at once when streaming
+    STREAM_CHUNK_SIZE = 100
+    # Collections whose change generations invalidate cached responses
+    CACHE_COLLECTIONS = ('samples', 'tags', 'campaigns')
+    # Serialized responses of this process, size is in megabytes
+    response_cache = ResponseCache(int(os.environ.get('RESPONSE_CACHE_SIZE', 128)) * 1024 * 1024)
 
     def multiarg_sort(self, list_of_objects, columns):
         """
         Sort list of objects based on multiple arguments
+        Strings are compared ignoring case
         """
-        def cmp_to_key(mycmp):
-            """
-            Convert a cmp= function into a key= function
-            """
-            class ComparerClass():
-                """
-                Class that implements all comparison methods
-                """
-                def __init__(self, obj, *args): #pylint: disable=unused-argument
-                    self.obj = obj
-
-                def __lt__(self, other):
-                    return mycmp(self.obj, other.obj) < 0
-
-                def __gt__(self, other):
-                    return mycmp(self.obj, other.obj) > 0
-
-                def __eq__(self, other):
-                    return mycmp(self.obj, other.obj) == 0
-
-                def __le__(self, other):
-                    return mycmp(self.obj, other.obj) <= 0
-
-                def __ge__(self, other):
-                    return mycmp(self.obj, other.obj) >= 0
-
-                def __ne__(self, other):
-                    return mycmp(self.obj, other.obj) != 0
-
-            return ComparerClass
+        def sort_key(obj):
+            return tuple(obj[c].lower() if isinstance(obj[c], str) else obj[c] for c in columns)
 
-        def comp(left_value, right_value):
-            for key in columns:
-                left = left_value[key]
-                right = right_value[key]
-                if isinstance(left, str) and isinstance(right, str):
-                    left = left.lower()
-                    right = right.lower()
+        list_of_objects.sort(key=sort_key)
 
-                if left < right:
-                    return -1
-
-                if left > right:
-                    return 1
+    def get_stream_format(self):
+        """
+        Return streaming format from "format" argument or Accept header,
+        None if response should not be streamed
+        """
+        stream_format = flask.request.args.get('format')
+        if stream_format:
+            return stream_format if stream_format in self.STREAM_FORMATS else None
 
-            return 0
+        ndjson = self.STREAM_FORMATS['ndjson']
+        accept = flask.request.accept_mimetypes
+        if accept.best_match([self.STREAM_FORMATS['stream'], ndjson]) == ndjson:
+            return 'ndjson'
 
-        list_of_objects.sort(key=cmp_to_key(comp))
+        return None
 
-    def get_xaod_version(self, prepid):
+    @classmethod
+    def get_table_format(cls):
         """
-        Return version of MiniAOD or NanoAOD of request
+        Return table format from "format" argument, None for the default format
         """
-        if not prepid:
-            return ''
-
-        prepid = prepid.lower()
-        if 'aod' in prepid:
-            # Remove v or APVv
-            version = prepid.split('aod')[-1].lstrip('apv')
-            version = version.replace(version.lstrip('0123456789'), '')
-            if version != '':
-                return f'v{version}'
+        table_format = flask.request.args.get('format')
+        return table_format if table_format in cls.TABLE_FORMATS else None
 
-            return 'v1'
+    @staticmethod
+    def read_dataset_names(upload):
+        """
+        Return unique dataset names of uploaded file that is read line by line
+        Lines may have multiple comma separated names
+        """
+        names = {}
+        for line in upload.stream:
+            for name in clean_split(line.decode('utf-8')):
+                names[name] = None
 
-        return ''
+        return list(names)
 
     def post(self):
         """
         Handle file upload
+        File is a list of dataset names, one per line, names may have wildcards
+        Response has number of found samples of each dataset name in "datasets"
+        CSV format is not supported because it has no place for "datasets"
         """
         args = flask.request.args
         files = flask.request.files
@@ -187,20 +120,45 @@ class GetSamplesAPI(APIBase):
             return {'response': [], 'success': False, 'message': 'No file'}
 
         try:
-            data = files['file'].read().decode('utf-8')
+            names = self.read_dataset_names(files['file'])
         except Exception as ex:
             return {'response': [], 'success': False, 'message': str(ex)}
 
-        self.logger.info('Getting samples %s and %s bytes data', args, len(data))
+        self.logger.info('Getting samples %s and %s dataset names', args, len(names))
         campaign = args.get('campaign')
         tags = args.get('tags')
         pwgs = args.get('pwgs')
-        dataset = ','.join(clean_split(data.replace('\n', ','), ','))
-        return self.get_samples(campaign, tags, pwgs, dataset)
-
+        fields = clean_split(args.get('fields', ''))
+        table_format = self.get_table_format()
+        if table_format == 'csv':
+            return {'response': [],
+                    'success': False,
+                    'message': 'CSV format is not supported for uploads, use "columns"'}
+
+        key = self.get_cache_key(campaign, tags, pwgs, ','.join(names), fields,
+                                 upload=True,
+                                 table_format=table_format)
+        return self.get_cached_response(key,
+                                        lambda: self.upload_samples(campaign,
+                                                                    tags,
+                                                                    pwgs,
+                                                                    names,
+                                                                    fields),
+                                        fields,
+                                        table_format)
+
+    @APIBase.with_etag(CACHE_COLLECTIONS)
     def get(self):
         """
         Handle normal GET method
+        Optional "fields" argument is a comma separated list of attributes to return
+        If "limit" (at most MAX_ROWS) or "after" arguments are given, samples are returned in
+        pages sorted by dataset, "after" is the "next" token of the previous page
+        If "format" argument is "stream" or "ndjson" or Accept header is
+        application/x-ndjson, all samples are streamed as they are read
+        If "format" argument is "columns", samples are returned as column names
+        and rows of values, if it is "csv", samples are returned as CSV, which
+        can not be used with pages as it has no place for the "next" token
         """
         args = flask.request.args
         self.logger.info('Getting samples %s', args)
@@ -208,11 +166,44 @@ class GetSamplesAPI(APIBase):
         tags = args.get('tags')
         pwgs = args.get('pwgs')
         dataset = args.get('dataset')
-        return self.get_samples(campaign, tags, pwgs, dataset)
-
-    def get_samples(self, campaign, tags, pwgs, dataset):
+        fields = clean_split(args.get('fields', ''))
+        page = None
+        if 'limit' in args or 'after' in args:
+            try:
+                limit = parse_limit(args.get('limit'), 1000, self.MAX_ROWS)
+            except ValueError as ex:
+                return {'response': [], 'success': False, 'message': str(ex)}
+
+            page = {'limit': limit, 'after': args.get('after')}
+
+        stream_format = None if page else self.get_stream_format()
+        if stream_format:
+            return self.get_samples(campaign, tags, pwgs, dataset, fields,
+                                    stream_format=stream_format)
+
+        table_format = self.get_table_format()
+        if table_format == 'csv' and page:
+            return {'response': [],
+                    'success': False,
+                    'message': 'CSV format is not supported for pages, use "columns"'}
+
+        key = self.get_cache_key(campaign, tags, pwgs, dataset, fields, page,
+                                 table_format=table_format)
+        return self.get_cached_response(key,
+                                        lambda: self.get_samples(campaign,
+                                                                 tags,
+                                                                 pwgs,
+                                                                 dataset,
+                                                                 fields,
+                                                                 page),
+                                        fields,
+                                        table_format)
+
+    @staticmethod
+    def build_query(campaign, tags, pwgs, dataset):
         """
-        Get samples in given campaign, with given tags/pwgs/dataset
+        Return query string of given campaign, tags, pwgs and dataset or None
+        if none of them are given
         """
         query = []
         if campaign:
@@ -227,29 +218,371 @@ class GetSamplesAPI(APIBase):
         if dataset:
             query.append('dataset=%s' % (dataset))
 
+        return '&&'.join(query) if query else None
+
+    def get_fields(self, fields):
+        """
+        Return attributes that should be returned to the user (None for all)
+        and attributes that should be fetched from the database
+        """
+        if not fields:
+            return None, sorted(set(self.SAMPLE_FIELDS) | set(self.REQUIRED_FIELDS))
+
+        output_fields = [f for f in fields if f in self.SAMPLE_FIELDS]
+        output_fields = list(dict.fromkeys(['_id'] + output_fields))
+        db_fields = sorted(set(self.REQUIRED_FIELDS) | set(output_fields))
+        return output_fields, db_fields
+
+    @staticmethod
+    def get_tag_names():
+        """
+        Return set of names of all existing tags
+        """
+        return ReferenceData.get_name_set('tags')
+
+    @staticmethod
+    def prepare_sample(entry, tags, derived_version):
+        """
+        Recompute outdated derived attributes, drop tags that no longer exist
+        and sort PWGs
+        """
+        if entry.get('derived_version') != derived_version:
+            # Sample was not updated since derived fields changed
+            add_derived_fields(entry)
+
+        entry.pop('derived_version', None)
+
+        entry['tags'] = sorted(list(tags & set(entry['tags'])))
+        if 'pwgs' in entry:
+            # PWGs are added to the end of the list
+            entry['pwgs'] = sorted(entry['pwgs'])
+
+        return entry
+
+    @staticmethod
+    def get_cache_key(campaign, tags, pwgs, dataset, fields=None, page=None, upload=False,
+                      table_format=None):
+        """
+        Return cache key of arguments, order and duplicates of comma
+        separated values do not matter, except order of uploaded dataset
+        names, because report of their matches follows it
+        """
+        key = [sorted(set(clean_split(value or ''))) for value in (campaign, tags, pwgs)]
+        datasets = clean_split(dataset or '')
+        key.append(datasets if upload else sorted(set(datasets)))
+        key.append(sorted(set(fields or [])))
+        key.append(page)
+        key.append(upload)
+        key.append(table_format)
+        return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def serialize_response(self, response, fields=None, table_format=None):
+        """
+        Return serialized response in given table format or as JSON
+        """
+        if not table_format:
+            return json.dumps(response, indent=1, sort_keys=True)
+
+        columns = self.get_fields(fields)[0] or sorted(self.SAMPLE_FIELDS)
+        if table_format == 'csv':
+            return to_csv(response['response'], columns)
+
+        response = dict(response, response=to_columns(response['response'], columns))
+        return json.dumps(response, separators=(',', ':'), sort_keys=True)
+
+    def get_cached_response(self, key, make_response, fields=None, table_format=None):
+        """
+        Return response from the response cache if samples, tags and campaigns
+        did not change since it was made, otherwise make it and cache it
+        Unsuccessful responses are not cached
+        """
+        generation = self.get_generations(self.CACHE_COLLECTIONS)
+        entry = self.response_cache.get(key, generation)
+        if entry is None:
+            response = make_response()
+            if not response['success']:
+                return response
+
+            body = self.serialize_response(response, fields, table_format)
+            entry = self.response_cache.set(key, generation, body, len(response['response']))
+        else:
+            self.logger.debug('Samples response cache hit')
+
+        content_type = self.TABLE_FORMATS.get(table_format, 'application/json')
+        return self.build_cached_response(entry, content_type)
+
+    def get_samples(self, campaign, tags, pwgs, dataset, fields=None, page=None,
+                    stream_format=None):
+        """
+        Get samples in given campaign, with given tags/pwgs/dataset
+        If fields are given, return only these attributes and _id
+        If page is given, return one page of samples sorted by dataset
+        If stream format is given, return a streamed response
+        """
+        query = self.build_query(campaign, tags, pwgs, dataset)
         if not query:
             return {'response': [], 'success': False, 'message': 'No campaign or tag specified'}
 
-        query = '&&'.join(query)
+        if stream_format:
+            return self.stream_samples(query, fields, stream_format)
+
+        output_fields, db_fields = self.get_fields(fields)
         sample_db = Database('samples')
-        tag_db = Database('tags')
-        tags = set(t['name'] for t in tag_db.query(limit=tag_db.get_count()))
-        results = sample_db.query(query, limit=25000, ignore_case=bool('*' in query))
+        tags = self.get_tag_names()
+        ignore_case = has_wildcard(query)
+        if page:
+            try:
+                results, next_page = sample_db.query_page(query,
+                                                          limit=page['limit'],
+                                                          sort_attr='dataset',
+                                                          ignore_case=ignore_case,
+                                                          fields=db_fields,
+                                                          after=page['after'])
+            except ValueError as ex:
+                return {'response': [], 'success': False, 'message': str(ex)}
+
+            total_rows = sample_db.count(query, ignore_case, cached=True)
+        else:
+            results, total_rows = sample_db.query_with_total_rows(query,
+                                                                  limit=self.MAX_ROWS,
+                                                                  ignore_case=ignore_case,
+                                                                  cached_count=True,
+                                                                  fields=db_fields)
+
+        results = self.process_samples(results, tags, output_fields, sort=not page)
+        response = {'response': results, 'total_rows': total_rows, 'success': True, 'message': ''}
+        if page:
+            response['next'] = next_page
+
+        return response
+
+    def process_samples(self, results, tags, output_fields=None, sort=True):
+        """
+        Prepare samples, sort them if needed and return only output fields
+        """
+        derived_version = get_derived_version()
         for entry in results:
-            entry['short_name'] = self.get_short_name(entry['dataset'])
-            entry['chain_tag'] = self.get_chain_tag(entry['chained_request'])
-            entry['miniaod_version'] = self.get_xaod_version(entry['miniaod'])
-            entry['nanoaod_version'] = self.get_xaod_version(entry['nanoaod'])
-            entry['tags'] = sorted(list(tags & set(entry['tags'])))
+            self.prepare_sample(entry, tags, derived_version)
+
+        if sort:
+            self.multiarg_sort(results, self.SORT_FIELDS)
 
-        self.multiarg_sort(results, ['short_name', 'dataset', 'root', 'miniaod', 'nanoaod'])
-        return {'response': results, 'success': True, 'message': ''}
+        if output_fields:
+            results = [{f: entry[f] for f in output_fields} for entry in results]
+
+        return results
+
+    def upload_samples(self, campaign, tags, pwgs, names, fields=None):
+        """
+        Get samples in given campaign, with given tags/pwgs, whose dataset is
+        one of given names
+        Exact names are looked up in chunks with $in, names with wildcards are
+        matched in a separate query, so their number is limited
+        """
+        if not names:
+            return {'response': [], 'success': False, 'message': 'No datasets in file'}
+
+        exact_names = [name for name in names if '*' not in name]
+        patterns = [name for name in names if '*' in name]
+        if len(patterns) > self.UPLOAD_MAX_PATTERNS:
+            return {'response': [],
+                    'success': False,
+                    'message': 'Too many dataset names with wildcards, %s > %s' % (
+                        len(patterns),
+                        self.UPLOAD_MAX_PATTERNS)}
+
+        query = self.build_query(campaign, tags, pwgs, None)
+        # Wildcard anywhere makes the whole query case insensitive
+        ignore_case = bool(patterns) or has_wildcard(query)
+        output_fields, db_fields = self.get_fields(fields)
+        sample_db = Database('samples')
+        results = list(sample_db.query_in('dataset',
+                                          exact_names,
+                                          query,
+                                          ignore_case=ignore_case,
+                                          fields=db_fields,
+                                          chunk_size=self.UPLOAD_CHUNK_SIZE,
+                                          limit=self.MAX_ROWS))
+        if patterns and len(results) < self.MAX_ROWS:
+            found_ids = set(r['_id'] for r in results)
+            pattern_query = self.build_query(campaign, tags, pwgs, ','.join(patterns))
+            pattern_results = sample_db.query(pattern_query,
+                                              limit=self.MAX_ROWS,
+                                              ignore_case=True,
+                                              fields=db_fields)
+            pattern_results = [r for r in pattern_results if r['_id'] not in found_ids]
+            results.extend(pattern_results[:self.MAX_ROWS - len(results)])
+
+        message = ''
+        if len(results) >= self.MAX_ROWS:
+            message = 'Only first %s samples are returned' % (self.MAX_ROWS)
+
+        datasets = self.count_dataset_matches(results, exact_names, patterns, ignore_case)
+        results = self.process_samples(results, self.get_tag_names(), output_fields)
+        return {'response': results,
+                'total_rows': len(results),
+                'datasets': datasets,
+                'success': True,
+                'message': message}
+
+    @staticmethod
+    def count_dataset_matches(results, exact_names, patterns, ignore_case):
+        """
+        Return list of dataset names and patterns with number of samples that
+        they matched
+        """
+        def normalize(name):
+            return name.lower() if ignore_case else name
+
+        found = Counter(normalize(r['dataset']) for r in results)
+        datasets = [{'dataset': name, 'samples': found.get(normalize(name), 0)}
+                    for name in exact_names]
+        for pattern in patterns:
+            regex = get_wildcard_regex(pattern.replace('**', '*').replace('*', '.*'), True)
+            samples = sum(count for name, count in found.items() if regex.search(name))
+            datasets.append({'dataset': pattern, 'samples': samples})
+
+        return datasets
+
+    def stream_samples(self, query, fields, stream_format):
+        """
+        Return a response that streams all samples of the query as they are
+        read from the database, either as the usual JSON object or as one
+        JSON object per line (NDJSON)
+        Samples are sorted by the database, so strings are compared with case,
+        unless a wildcard makes the query case insensitive, then its collation
+        also applies to the sort
+        """
+        output_fields, db_fields = self.get_fields(fields)
+        tags = self.get_tag_names()
+        derived_version = get_derived_version()
+        samples = Database('samples').iterate(query,
+                                              batch_size=self.STREAM_CHUNK_SIZE,
+                                              fields=db_fields,
+                                              sort_attr=self.SORT_FIELDS,
+                                              ignore_case=has_wildcard(query),
+                                              allow_disk_use=True)
+        ndjson = stream_format == 'ndjson'
+
+        def generate():
+            """
+            Yield serialized chunks of samples
+            Keys of JSON object are in the same order as in non-streamed response
+            """
+            if not ndjson:
+                yield '{"message": "", "response": [\n'
+
+            rows = 0
+            chunk = []
+            for entry in samples:
+                entry = self.prepare_sample(entry, tags, derived_version)
+                if output_fields:
+                    entry = {f: entry[f] for f in output_fields}
+
+                chunk.append(json.dumps(entry, sort_keys=True))
+                rows += 1
+                if len(chunk) >= self.STREAM_CHUNK_SIZE:
+                    yield self.join_chunk(chunk, ndjson, rows == len(chunk))
+                    chunk = []
+
+            if chunk:
+                yield self.join_chunk(chunk, ndjson, rows == len(chunk))
+
+            if not ndjson:
+                yield '\n], "success": true, "total_rows": %s}' % (rows)
+
+            self.logger.info('Streamed %s samples', rows)
+
+        return self.build_stream_response(generate(),
+                                          content_type=self.STREAM_FORMATS[stream_format])
+
+    @staticmethod
+    def join_chunk(chunk, ndjson, first):
+        """
+        Join serialized samples to a part of NDJSON or of a JSON array
+        """
+        if ndjson:
+            return '\n'.join(chunk) + '\n'
+
+        return ('' if first else ',\n') + ',\n'.join(chunk)
+
+
+class GetSamplesSummaryAPI(APIBase):
+    """
+    Endpoint for getting numbers of samples and sums of their events grouped
+    by attributes
+    """
+
+    # Attributes that samples can be grouped by
+    GROUP_FIELDS = ['campaign', 'short_name', 'chain_tag', 'miniaod_version', 'nanoaod_version',
+                    'root_status', 'miniaod_status', 'nanoaod_status', 'tags', 'pwgs']
+    # Array attributes where each value makes a separate group
+    ARRAY_FIELDS = ['tags', 'pwgs']
+    # Attributes that are summed in each group
+    SUM_FIELDS = ['root_total_events', 'root_done_events',
+                  'miniaod_total_events', 'miniaod_done_events',
+                  'nanoaod_total_events', 'nanoaod_done_events']
+    # Collections whose change generations invalidate cached summaries
+    CACHE_COLLECTIONS = ('samples', 'tags')
+    CACHE_TIMEOUT = 3600
+    summary_cache = SimpleCache(threshold=500)
+
+    @APIBase.with_etag(CACHE_COLLECTIONS)
+    def get(self):
+        """
+        Get number of samples and sums of their events grouped by attributes
+        "group_by" is a comma separated list of attributes, default is campaign
+        Samples are selected with "query" argument in the same syntax as other
+        queries, e.g. campaign=Run3*&&root_status=done, and campaign, tags,
+        pwgs and dataset arguments, all samples are used if none are given
+        """
+        args = flask.request.args
+        group_by = list(dict.fromkeys(clean_split(args.get('group_by', 'campaign'))))
+        invalid = [attr for attr in group_by if attr not in self.GROUP_FIELDS]
+        if invalid or not group_by:
+            return {'response': [],
+                    'success': False,
+                    'message': 'Invalid group_by, allowed: %s' % (', '.join(self.GROUP_FIELDS))}
+
+        query = [args.get('query'), GetSamplesAPI.build_query(args.get('campaign'),
+                                                              args.get('tags'),
+                                                              args.get('pwgs'),
+                                                              args.get('dataset'))]
+        query = '&&'.join(part for part in query if part)
+        self.logger.info('Getting summary of samples %s grouped by %s', query, group_by)
+        sample_db = Database('samples')
+        generation = self.get_generations(self.CACHE_COLLECTIONS)
+        cache_key = json.dumps([generation, query, group_by])
+        response = self.summary_cache.get(cache_key)
+        if response is not None:
+            return response
+
+        array_values = {attr: None for attr in self.ARRAY_FIELDS}
+        if 'tags' in group_by:
+            # Deleted tags are not shown, same as in samples
+            array_values['tags'] = list(ReferenceData.get_names('tags'))
+
+        results = sample_db.summarize(query,
+                                      group_by,
+                                      self.SUM_FIELDS,
+                                      ignore_case=has_wildcard(query),
+                                      array_values=array_values)
+        results.sort(key=lambda r: tuple(('' if r[a] is None else str(r[a])) for a in group_by))
+        response = {'response': results, 'total_rows': len(results), 'success': True, 'message': ''}
+        self.summary_cache.set(cache_key, response, timeout=self.CACHE_TIMEOUT)
+        return response
 
 
 class UpdateSampleAPI(APIBase):
     """
     Endpoint for updating entries in a samples table
     """
+    # Actions and attributes that they change
+    ACTIONS = {'add_tag': 'tags',
+               'remove_tag': 'tags',
+               'add_pwg': 'pwgs',
+               'remove_pwg': 'pwgs'}
+
     def __init__(self):
         APIBase.__init__(self)
         self.tags = None
@@ -261,84 +594,144 @@ class UpdateSampleAPI(APIBase):
         """
         Update entries in existing samples table based on entry id
         Valid actions: add_tag, remove_tag, add_pwg, remove_pwg
+        Changes are grouped by root and applied to all samples in a single
+        batched bulk write, so concurrent edits of the same samples are not
+        lost, each sample is updated atomically, but the batch as a whole is not
         """
         if not isinstance(data, list):
             data = [data]
 
         self.logger.info('Editing existing samples %s', data)
-        updated_entries = []
-        sample_db = Database('samples')
-        all_tags = set(self.get_all_tags())
+        # Root -> attribute -> value -> whether it is added, later entries win
+        changes = {}
+        valid_entries = []
         for entry in data:
             try:
                 entry_root = entry['prepid']
                 entry_action = entry['action']
                 entry_value = entry['value']
                 self.logger.info('Updating %s (%s): %s', entry_root, entry_action, entry_value)
-                samples = sample_db.query(f'root={entry_root}')
-                for sample in samples:
-                    if entry_action in ('add_tag', 'remove_tag'):
-                        if entry_value not in all_tags:
-                            self.logger.info('Invalid tag %s', entry_value)
-                            continue
-
-                        tags = sample['tags']
-                        if entry_action == 'add_tag':
-                            tags += [entry_value]
-                        elif entry_value in tags:
-                            tags.remove(entry_value)
-                        else:
-                            continue
-
-                        sample['tags'] = sorted(list(set(tags)))
-                    elif entry_action in ('add_pwg', 'remove_pwg'):
-                        if entry_value not in self.get_all_pwgs():
-                            self.logger.info('Invalid pwg %s', entry_value)
-                            continue
-
-                        pwgs = sample['pwgs']
-                        if entry_action == 'add_pwg':
-                            pwgs += [entry_value]
-                        elif entry_value in pwgs:
-                            pwgs.remove(entry_value)
-                        else:
-                            continue
-
-                        sample['pwgs'] = sorted(list(set(pwgs)))
-                    else:
-                        self.logger.warning('Invalid action')
-                        continue
-
-                    sample['tags'] = sorted(list(all_tags & set(sample['tags'])))
-                    sample_db.save(sample)
-                    updated_entries.append({'_id': sample['_id'],
-                                            'tags': sample['tags'],
-                                            'pwgs': sample['pwgs']})
-                    self.add_history_entry(sample['root'],
-                                           entry_action.replace('_', ' '),
-                                           entry_value)
+                if not self.is_valid_change(entry_action, entry_value):
+                    continue
+
+                attribute_changes = changes.setdefault(entry_root, {})
+                values = attribute_changes.setdefault(self.ACTIONS[entry_action], {})
+                values[entry_value] = entry_action.startswith('add_')
+                valid_entries.append((entry_root, entry_action, entry_value))
             except Exception as ex:
                 self.logger.error(ex)
 
+        if not changes:
+            return {'response': [], 'success': True, 'message': ''}
+
+        sample_db = Database('samples')
+        # Samples are read before the update to know which changes do something
+        samples = sample_db.query_in('root', list(changes), fields=['root', 'tags', 'pwgs'])
+        effective_changes = self.get_effective_changes(samples, changes)
+        updates = []
+        for root, attribute_changes in changes.items():
+            for update in self.make_updates(attribute_changes):
+                updates.append(({'root': root}, update))
+
+        result = sample_db.bulk_update(updates)
+        if result and result.modified_count:
+            sample_db.bump_generation()
+
+        samples = sample_db.query_in('root', list(changes), fields=['_id', 'root', 'tags', 'pwgs'])
+        all_tags = self.get_all_tags()
+        updated_entries = []
+        for sample in samples:
+            updated_entries.append({'_id': sample['_id'],
+                                    'tags': sorted(list(all_tags & set(sample['tags']))),
+                                    'pwgs': sorted(sample['pwgs'])})
+
+        for entry_root, entry_action, entry_value in valid_entries:
+            attribute = self.ACTIONS[entry_action]
+            change = (entry_root, attribute, entry_value)
+            # Only the last action of a value is applied and written once
+            is_added = entry_action.startswith('add_')
+            is_applied = changes[entry_root][attribute][entry_value] == is_added
+            if is_applied and change in effective_changes:
+                effective_changes.remove(change)
+                self.add_history_entry(entry_root, entry_action.replace('_', ' '), entry_value)
+
         return {'response': updated_entries, 'success': True, 'message': ''}
 
+    def is_valid_change(self, action, value):
+        """
+        Return whether action is valid and its value is an existing tag or PWG
+        """
+        attribute = self.ACTIONS.get(action)
+        if not attribute:
+            self.logger.warning('Invalid action %s', action)
+            return False
+
+        allowed_values = self.get_all_tags() if attribute == 'tags' else self.get_all_pwgs()
+        if value not in allowed_values:
+            self.logger.info('Invalid %s %s', attribute[:-1], value)
+            return False
+
+        return True
+
+    @staticmethod
+    def get_effective_changes(samples, changes):
+        """
+        Return set of (root, attribute, value) changes that add a value that
+        some sample of the root does not have or remove a value that some
+        sample of the root has
+        """
+        effective_changes = set()
+        for sample in samples:
+            root = sample['root']
+            for attribute, values in changes[root].items():
+                sample_values = set(sample.get(attribute, []))
+                for value, is_added in values.items():
+                    if is_added != (value in sample_values):
+                        effective_changes.add((root, attribute, value))
+
+        return effective_changes
+
+    @staticmethod
+    def make_updates(attribute_changes):
+        """
+        Return list of updates that add and remove values of attributes
+        Added and removed values are separate updates, because one update
+        can not both add to and remove from the same array
+        """
+        add_values = {}
+        remove_values = {}
+        for attribute, values in attribute_changes.items():
+            added = sorted(value for value, is_added in values.items() if is_added)
+            removed = sorted(value for value, is_added in values.items() if not is_added)
+            if added:
+                add_values[attribute] = {'$each': added}
+
+            if removed:
+                remove_values[attribute] = {'$in': removed}
+
+        updates = []
+        if add_values:
+            updates.append({'$addToSet': add_values})
+
+        if remove_values:
+            updates.append({'$pull': remove_values})
+
+        return updates
+
     def get_all_tags(self):
         """
-        Fetch all tags from the databse
+        Get set of all tags
         """
         if not self.tags:
-            tag_db = Database('tags')
-            tags = tag_db.query(limit=tag_db.get_count())
-            tags = [c['name'] for c in tags]
-            self.tags = tags
+            self.tags = ReferenceData.get_name_set('tags')
 
         return self.tags
 
     def get_all_pwgs(self):
         """
-        Get all valid PWGs
+        Get set of all valid PWGs
         """
         if not self.pwgs:
-            self.pwgs = get_pwgs()
+            self.pwgs = frozenset(get_pwgs())
 
         return self.pwgs
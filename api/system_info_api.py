@@ -3,8 +3,13 @@ Module with all system APIs
 """
 import flask
 from api.api_base import APIBase
+from api.samples_api import GetSamplesAPI
 from utils.grasp_database import Database
+from utils.metrics import Metrics
+from utils.query_compiler import query_cache_info
+from utils.search_index import DatasetSearchIndex
 from utils.user import User
+from utils.utils import parse_limit
 
 
 class UserInfoAPI(APIBase):
@@ -23,26 +28,33 @@ class UserActionHistory(APIBase):
     """
     Endpoing for getting list of user actions
     """
+
+    MAX_LIMIT = 999
+
     def __init__(self):
         APIBase.__init__(self)
 
     def get(self, username=None):
         """
         Fetch a list of all users' or a particular user's actions
+        Optional "limit" argument is page size, at most 999, and "after" is the "next" token
+        of the previous page
         """
+        args = flask.request.args
+        after = args.get('after')
         history_db = Database('history')
-        if username:
-            entries = history_db.query(f'user={username}',
-                                       limit=999,
-                                       sort_attr='time',
-                                       sort_asc=False)
-        else:
-            entries = history_db.query('user=*',
-                                       limit=999,
-                                       sort_attr='time',
-                                       sort_asc=False)
+        query = f'user={username}' if username else None
+        try:
+            limit = parse_limit(args.get('limit'), self.MAX_LIMIT, self.MAX_LIMIT)
+            entries, next_page = history_db.query_page(query,
+                                                       limit=limit,
+                                                       sort_attr='time',
+                                                       sort_asc=False,
+                                                       after=after)
+        except ValueError as ex:
+            return {'response': [], 'success': False, 'message': str(ex)}
 
-        return {'response': entries, 'success': True, 'message': ''}
+        return {'response': entries, 'next': next_page, 'success': True, 'message': ''}
 
 
 class SearchAPI(APIBase):
@@ -50,6 +62,9 @@ class SearchAPI(APIBase):
     Endpoint that is used for abstract search in the whole database
     """
 
+    # Index shared by all requests
+    index = DatasetSearchIndex()
+
     def get(self):
         """
         Perform a search
@@ -63,15 +78,27 @@ class SearchAPI(APIBase):
         if len(dataset.replace('*', '')) < 3:
             return {'response': [], 'success': True, 'message': 'Query string too short'}
 
-        query = f'dataset=*{dataset}*'
         campaign = args.pop('c', '')
-        if campaign:
-            query += f'&&campaign={campaign}'
-
         self.logger.info('Search for dataset "%s" and campaign "%s"', dataset, campaign)
-        sample_db = Database('samples')
-        # Fetch 50 items, in case there are duplicates
-        results = sample_db.query(query, 0, 50, ignore_case=True)
-        # Return only 30
-        results = sorted(set(r['dataset'] for r in results))[:20]
+        results = self.index.search(dataset, campaign, limit=20)
         return {'response': results, 'success': True, 'message': ''}
+
+
+class MetricsAPI(APIBase):
+    """
+    Endpoint for getting metrics of this process in Prometheus text format
+    """
+    def get(self):
+        """
+        Get request latency, response size and row count histograms, requests
+        in flight and cache statistics
+        """
+        gauges = {}
+        for name, value in query_cache_info().items():
+            gauges[f'query_cache_{name}'] = (f'Compiled query cache {name}', value)
+
+        for name, value in GetSamplesAPI.response_cache.info().items():
+            gauges[f'samples_response_cache_{name}'] = (f'Samples response cache {name}', value)
+
+        return self.build_response(Metrics.render(gauges),
+                                   content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,6 +3,7 @@ Module with all tags' APIs
 """
 from api.api_base import APIBase
 from utils.grasp_database import Database
+from utils.reference_data import ReferenceData
 from utils.user import Role
 from utils.utils import make_regex_matcher as regex
 
@@ -26,6 +27,8 @@ class CreateTagAPI(APIBase):
         tag_db = Database('tags')
         tag = {'_id': name, 'name': name}
         tag_db.save(tag)
+        tag_db.bump_generation()
+        ReferenceData.invalidate('tags')
         self.add_history_entry('', 'create tag', name)
         return {'response': tag, 'success': True, 'message': ''}
 
@@ -34,14 +37,13 @@ class GetTagsAPI(APIBase):
     """
     Endpoint for getting list of tag
     """
+    @APIBase.with_etag(['tags'])
     def get(self):
         """
         Get a single existing tag with all entries inside
         """
         self.logger.info('Getting tags')
-        tag_db = Database('tags')
-        tags = tag_db.query(limit=tag_db.get_count())
-        tags = [c['name'] for c in tags]
+        tags = list(ReferenceData.get_names('tags'))
         return {'response': tags, 'success': True, 'message': ''}
 
 
@@ -57,6 +59,8 @@ class DeleteTagAPI(APIBase):
         self.logger.info('Deleting tag %s', tag)
         tag_db = Database('tags')
         tag_db.delete_document({'_id': tag})
+        tag_db.bump_generation()
+        ReferenceData.invalidate('tags')
         # Entries from samples database should be deleted during next update
         self.add_history_entry('', 'delete tag', tag)
         return {'response': None, 'success': True, 'message': ''}
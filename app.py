@@ -20,8 +20,8 @@ from core_lib.middlewares.auth import AuthenticationMiddleware
 from core_lib.utils.username_filter import UsernameFilter
 from api.campaigns_api import CreateCampaignAPI, GetCampaignsAPI, DeleteCampaignAPI
 from api.tags_api import CreateTagAPI, GetTagsAPI, DeleteTagAPI
-from api.samples_api import GetSamplesAPI, UpdateSampleAPI
-from api.system_info_api import UserInfoAPI, UserActionHistory, SearchAPI
+from api.samples_api import GetSamplesAPI, GetSamplesSummaryAPI, UpdateSampleAPI
+from api.system_info_api import UserInfoAPI, UserActionHistory, SearchAPI, MetricsAPI
 from utils.utils import get_api_documentation
 from utils.grasp_database import Database
 
@@ -39,6 +39,8 @@ CORS(
     allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Credentials"],
     supports_credentials=True,
 )
+# Streamed responses would be buffered as a whole to be compressed
+app.config["COMPRESS_STREAMS"] = False
 Compress(app=app)
 
 
@@ -83,6 +85,7 @@ api.add_resource(
     UserActionHistory, "/api/system/history", "/api/system/history/<string:username>"
 )
 api.add_resource(SearchAPI, "/api/search")
+api.add_resource(MetricsAPI, "/api/system/metrics")
 
 # Campaigns
 api.add_resource(CreateCampaignAPI, "/api/campaigns/create")
@@ -96,6 +99,7 @@ api.add_resource(DeleteTagAPI, "/api/tags/delete/<string:tag>")
 
 # Samples
 api.add_resource(GetSamplesAPI, "/api/samples/get")
+api.add_resource(GetSamplesSummaryAPI, "/api/samples/summary")
 api.add_resource(UpdateSampleAPI, "/api/samples/update")
 
 
@@ -194,3 +198,19 @@ def set_app(debug: bool = True) -> None:
         "Using credentials from environment - Database username: %s", db_username
     )
     Database.set_credentials(username=db_username, password=db_password)
+
+    # Log slow database queries
+    slow_query_threshold = float(os.getenv("DB_SLOW_QUERY_THRESHOLD", "1.0"))
+    slow_query_explain = bool(os.getenv("DB_SLOW_QUERY_EXPLAIN"))
+    logger.info(
+        "Logging database queries slower than %ss, explain: %s",
+        slow_query_threshold,
+        slow_query_explain,
+    )
+    Database.set_slow_query_log(slow_query_threshold, slow_query_explain)
+
+    # Make sure collections are indexed
+    try:
+        Database.ensure_all_indexes()
+    except Exception as ex:
+        logger.error("Could not ensure database indexes: %s", ex)
@@ -5,6 +5,8 @@ please see: https://docs.gunicorn.org/en/stable/configure.html
 """
 import os
 from app import set_app
+from utils.grasp_database import Database
+from utils.history_writer import HistoryWriter
 
 debug: bool = bool(os.getenv("DEBUG"))
 set_app(debug=debug)
@@ -13,3 +15,12 @@ port: int = int(os.environ.get("PORT", 8002))
 bind: str = f"{host}:{port}"
 workers: int = 1
 threads: int = 10
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """
+    Write queued history entries and close shared database clients when a
+    worker exits
+    """
+    HistoryWriter.stop()
+    Database.close_clients()
@@ -0,0 +1,44 @@
+"""
+Tests of GrASP
+Run with python3 -m unittest discover -s tests -t . (requires tests/requirements.txt)
+"""
+import unittest
+from unittest import mock
+import mongomock # pylint: disable=import-error
+from cachelib import SimpleCache
+from api.samples_api import GetSamplesAPI, GetSamplesSummaryAPI
+from utils.grasp_database import Database
+from utils.metrics import Metrics
+from utils.reference_data import ReferenceData
+from utils.response_cache import ResponseCache
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Test case with an empty mongomock database and empty shared caches and
+    metrics, class attributes are restored after each test
+    """
+
+    def setUp(self):
+        patcher = mock.patch('utils.grasp_database.MongoClient', mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.replace(Database, 'clients', {})
+        self.replace(Database, 'clients_pid', None)
+        self.replace(Database, 'DATABASE_NAME', 'test')
+        self.replace(Database, 'count_cache', SimpleCache(threshold=1000))
+        self.replace(ReferenceData, 'entries', {})
+        self.replace(ReferenceData, 'invalidations', {})
+        self.replace(GetSamplesAPI,
+                     'response_cache',
+                     ResponseCache(GetSamplesAPI.response_cache.max_size))
+        self.replace(GetSamplesSummaryAPI, 'summary_cache', SimpleCache(threshold=500))
+        for name in ('durations', 'sizes', 'rows', 'in_flight'):
+            self.replace(Metrics, name, {})
+
+    def replace(self, owner, name, value):
+        """
+        Set class attribute for the duration of a test
+        """
+        self.addCleanup(setattr, owner, name, getattr(owner, name))
+        setattr(owner, name, value)
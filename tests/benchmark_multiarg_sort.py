@@ -0,0 +1,126 @@
+"""
+Benchmark of sorting samples with the previous comparison function sort and
+the current key sort of GetSamplesAPI.multiarg_sort
+Run with python3 -m tests.benchmark_multiarg_sort [--rows 25000] [--repeat 5]
+"""
+import argparse
+import random
+import string
+import time
+from api.samples_api import GetSamplesAPI
+
+
+def legacy_multiarg_sort(list_of_objects, columns):
+    """
+    Previous sort that compared objects with a comparison function
+    """
+    def cmp_to_key(mycmp):
+        """
+        Convert a cmp= function into a key= function
+        """
+        class ComparerClass():
+            """
+            Class that implements all comparison methods
+            """
+            def __init__(self, obj, *args): #pylint: disable=unused-argument
+                self.obj = obj
+
+            def __lt__(self, other):
+                return mycmp(self.obj, other.obj) < 0
+
+            def __gt__(self, other):
+                return mycmp(self.obj, other.obj) > 0
+
+            def __eq__(self, other):
+                return mycmp(self.obj, other.obj) == 0
+
+            def __le__(self, other):
+                return mycmp(self.obj, other.obj) <= 0
+
+            def __ge__(self, other):
+                return mycmp(self.obj, other.obj) >= 0
+
+            def __ne__(self, other):
+                return mycmp(self.obj, other.obj) != 0
+
+        return ComparerClass
+
+    def comp(left_value, right_value):
+        for key in columns:
+            left = left_value[key]
+            right = right_value[key]
+            if isinstance(left, str) and isinstance(right, str):
+                left = left.lower()
+                right = right.lower()
+
+            if left < right:
+                return -1
+
+            if left > right:
+                return 1
+
+        return 0
+
+    list_of_objects.sort(key=cmp_to_key(comp))
+
+
+def make_samples(rows, seed=0):
+    """
+    Return list of samples with random values of sort fields, many of them
+    share short name and dataset, like samples of one campaign
+    """
+    rng = random.Random(seed)
+
+    def word(length):
+        return ''.join(rng.choice(string.ascii_letters) for _ in range(length))
+
+    short_names = [word(8) for _ in range(max(1, rows // 50))]
+    datasets = [word(30) for _ in range(max(1, rows // 5))]
+    return [{'short_name': rng.choice(short_names),
+             'dataset': rng.choice(datasets),
+             'root': f'HIG-Run3Summer22wmLHEGS-{index:05d}',
+             'miniaod': f'HIG-Run3Summer22MiniAODv4-{rng.randint(0, 99999):05d}',
+             'nanoaod': f'HIG-Run3Summer22NanoAODv12-{rng.randint(0, 99999):05d}'}
+            for index in range(rows)]
+
+
+def measure(sort, samples, repeat):
+    """
+    Return best time of sorting copies of samples and the sorted list
+    """
+    best = None
+    for _ in range(repeat):
+        rows = list(samples)
+        start = time.perf_counter()
+        sort(rows, GetSamplesAPI.SORT_FIELDS)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+
+    return best, rows
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description='Benchmark of sorting samples')
+    parser.add_argument('--rows', help='Number of samples, default is MAX_ROWS', type=int,
+                        default=GetSamplesAPI.MAX_ROWS)
+    parser.add_argument('--repeat', help='Number of repetitions, default is 5', type=int,
+                        default=5)
+    args = parser.parse_args()
+    samples = make_samples(args.rows)
+    api = GetSamplesAPI()
+    legacy_time, legacy_rows = measure(legacy_multiarg_sort, samples, args.repeat)
+    key_time, key_rows = measure(api.multiarg_sort, samples, args.repeat)
+    if legacy_rows != key_rows:
+        raise AssertionError('Sorts returned samples in different order')
+
+    print(f'Rows: {args.rows}, best of {args.repeat}')
+    print(f'Comparison function sort: {legacy_time * 1000:.1f} ms')
+    print(f'Key sort: {key_time * 1000:.1f} ms')
+    print(f'Speedup: {legacy_time / key_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Tests of database queries
+Run with python3 -m unittest discover -s tests -t . (requires tests/requirements.txt)
+"""
+import unittest
+from unittest import mock
+from utils.grasp_database import Database
+from tests import DatabaseTestCase
+
+
+class QueryInTest(DatabaseTestCase):
+    """
+    Lists of values are matched like values of compiled queries
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sample_db = Database('samples')
+        self.sample_db.bulk_save([{'_id': f'{campaign}_{dataset}',
+                                   'campaign': campaign,
+                                   'dataset': dataset}
+                                  for campaign in ('Run3', 'run3', 'Other')
+                                  for dataset in ('TTTo', 'ttto', 'QCD')])
+
+    def query_in(self, values, query_string, ignore_case):
+        """
+        Return sorted ids of samples whose dataset is one of values
+        """
+        return sorted(s['_id'] for s in self.sample_db.query_in('dataset',
+                                                                values,
+                                                                query_string,
+                                                                ignore_case=ignore_case))
+
+    def test_collation(self):
+        """
+        Case insensitive lookup uses collation if query has no conditions
+        """
+        with mock.patch.object(Database, 'fetch', autospec=True, return_value=[]) as fetch:
+            self.query_in(['TTTo'], 'campaign=Run3', True)
+
+        query = fetch.call_args[0][1]
+        self.assertIsNotNone(query['collation'])
+        self.assertEqual(query['filter']['$and'][1], {'dataset': {'$in': ['TTTo']}})
+
+    def test_conditions(self):
+        """
+        Collation is not used with conditions, values are matched with regexes
+        and conditions stay case sensitive
+        """
+        with mock.patch.object(Database, 'fetch', autospec=True, return_value=[]) as fetch:
+            self.query_in(['TTTo'], 'campaign=!run3', True)
+
+        self.assertIsNone(fetch.call_args[0][1]['collation'])
+        self.assertEqual(self.query_in(['TTTo'], 'campaign=!run3', True),
+                         ['Other_TTTo', 'Other_ttto', 'Run3_TTTo', 'Run3_ttto'])
+
+    def test_case_sensitive(self):
+        """
+        Values are matched exactly if case is not ignored
+        """
+        self.assertEqual(self.query_in(['TTTo', 'QCD'], 'campaign=Run3', False),
+                         ['Run3_QCD', 'Run3_TTTo'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests of conditional GET of listings with ETags
+Run with python3 -m unittest discover -s tests -t . (requires tests/requirements.txt)
+"""
+import unittest
+from unittest import mock
+from flask import Flask
+from flask_compress import Compress
+from flask_restful import Api
+from api.samples_api import GetSamplesAPI
+from api.tags_api import GetTagsAPI
+from utils.grasp_database import Database
+from tests import DatabaseTestCase
+
+
+class ETagTest(DatabaseTestCase):
+    """
+    Responses of unchanged collections are not sent again, also when they
+    were compressed by Flask-Compress
+    """
+
+    def setUp(self):
+        super().setUp()
+        tag_db = Database('tags')
+        tag_db.bulk_save([{'_id': f'tag_{i}', 'name': f'tag_{i}'} for i in range(100)])
+        app = Flask(__name__)
+        app.config['COMPRESS_MIN_SIZE'] = 0
+        api = Api(app)
+        api.add_resource(GetTagsAPI, '/api/tags/get_all')
+        api.add_resource(GetSamplesAPI, '/api/samples/get')
+        Compress(app=app)
+        self.client = app.test_client()
+
+    def revalidate(self, headers):
+        """
+        Get tags, then get them again with ETag of the first response
+        """
+        first = self.client.get('/api/tags/get_all', headers=headers)
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        second = self.client.get('/api/tags/get_all',
+                                 headers=dict(headers, **{'If-None-Match': etag}))
+        return first, second
+
+    def test_not_modified(self):
+        """
+        Uncompressed response is not sent again
+        """
+        _, second = self.revalidate({})
+        self.assertEqual(second.status_code, 304)
+
+    def test_not_modified_compressed(self):
+        """
+        Compressed response with ETag changed by Flask-Compress is not sent again
+        """
+        first, second = self.revalidate({'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(first.headers['ETag'].endswith(':gzip"'))
+        self.assertEqual(second.status_code, 304)
+
+    def test_modified(self):
+        """
+        Response is sent again after collection changed
+        """
+        first = self.client.get('/api/tags/get_all', headers={'Accept-Encoding': 'gzip'})
+        Database('tags').bump_generation()
+        second = self.client.get('/api/tags/get_all',
+                                 headers={'Accept-Encoding': 'gzip',
+                                          'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 200)
+
+    def test_generations_read_once(self):
+        """
+        Generations read for the ETag are reused by the response cache
+        """
+        with mock.patch.object(Database, 'get_generations',
+                               autospec=True,
+                               side_effect=Database.get_generations) as get_generations:
+            resp = self.client.get('/api/samples/get?campaign=Run3*')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(get_generations.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests of request metrics
+Run with python3 -m unittest discover -s tests -t .
+"""
+import time
+import unittest
+from flask import Flask
+from flask_compress import Compress
+from flask_restful import Api
+from api.api_base import APIBase
+from utils.metrics import Metrics
+from utils.response_cache import ResponseCache
+from tests import DatabaseTestCase
+
+
+class SlowStreamAPI(APIBase):
+    """
+    Endpoint that streams its body slowly
+    """
+
+    def get(self):
+        """
+        Stream two chunks with a pause between them
+        """
+        def generate():
+            yield '['
+            time.sleep(0.1)
+            yield ']'
+
+        return self.build_stream_response(generate())
+
+
+class CachedAPI(APIBase):
+    """
+    Endpoint that returns a cached body
+    """
+
+    cache = ResponseCache(1024 * 1024)
+
+    def get(self):
+        """
+        Return the same cached body
+        """
+        entry = self.cache.set('key', (0,), '[' + ', '.join(['1'] * 1000) + ']', 1000)
+        return self.build_cached_response(entry)
+
+
+class MetricsTest(DatabaseTestCase):
+    """
+    Durations include sending of streamed bodies and sizes are uncompressed
+    """
+
+    def setUp(self):
+        super().setUp()
+        app = Flask(__name__)
+        app.config['COMPRESS_STREAMS'] = False
+        api = Api(app)
+        api.add_resource(SlowStreamAPI, '/stream')
+        api.add_resource(CachedAPI, '/cached')
+        Compress(app=app)
+        self.client = app.test_client()
+
+    def test_stream_duration(self):
+        """
+        Streamed request ends after its body was sent
+        """
+        resp = self.client.get('/stream')
+        self.assertEqual(resp.data, b'[]')
+        # Server closes the response after sending it
+        resp.close()
+        histogram = Metrics.durations[('/stream', 'GET', '200')]
+        self.assertEqual(histogram.count, 1)
+        self.assertGreaterEqual(histogram.total, 0.1)
+        self.assertEqual(Metrics.in_flight[('/stream', 'GET')], 0)
+        self.assertNotIn(('/stream', 'GET', '200'), Metrics.sizes)
+
+    def test_cached_size(self):
+        """
+        Size of a compressed cached body is its uncompressed size
+        """
+        resp = self.client.get('/cached', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        size = len(CachedAPI.cache.get('key', (0,))[0])
+        self.assertEqual(Metrics.sizes[('/cached', 'GET', '200')].total, size)
+        self.assertEqual(Metrics.rows[('/cached', 'GET', '200')].total, 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
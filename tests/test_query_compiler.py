@@ -0,0 +1,163 @@
+"""
+Tests that compiled queries match the same documents as queries of the
+previous compiler, which matched every value with a separate $or condition
+and case insensitive values with regexes
+Run with python3 -m unittest discover -s tests -t . (requires tests/requirements.txt)
+"""
+import itertools
+import re
+import unittest
+import mongomock # pylint: disable=import-error
+from utils.query_compiler import compile_query
+
+
+def legacy_get_value_query(key, values, ignore_case=False):
+    """
+    Value query of the previous compiler
+    """
+    value_or = []
+    for value in values:
+        value = value.strip()
+        value_condition = None
+        if value[0] in '<>!':
+            value_condition = {'<': '$lt', '>': '$gt', '!': '$ne'}[value[0]]
+            value = value[1:]
+
+        attribute = key.replace('<int>', '').replace('<float>', '').replace('<bool>', '')
+        if '<int>' in key:
+            value = int(value)
+        elif '<float>' in key:
+            value = float(value)
+        elif '<bool>' in key:
+            value = bool(value.lower() in ('true', 'yes'))
+        elif not value_condition and ignore_case:
+            value = re.compile(f'^{value}$', re.IGNORECASE)
+
+        if value_condition:
+            value_or.append({attribute: {value_condition: value}})
+        elif isinstance(value, (str, re.Pattern)) and '*' in str(value):
+            value_or.append({attribute: {'$regex': value}})
+        else:
+            value_or.append({attribute: value})
+
+    if len(value_or) > 1:
+        return {'$or': value_or}
+
+    return value_or[0] if value_or else None
+
+
+def legacy_compile_query(query_string, ignore_case=False):
+    """
+    Filter of the previous compiler
+    """
+    query_dict = {'$and': []}
+    for part in [x for x in query_string.split('&&') if x.strip()]:
+        key, values = part.split('=', 1)
+        values = values.strip().replace('**', '*').replace('*', '.*')
+        values = [value.strip() for value in values.split(',') if value.strip()]
+        if not values:
+            return None
+
+        query_dict['$and'].append(legacy_get_value_query(key.strip(), values, ignore_case))
+
+    if len(query_dict['$and']) == 1:
+        return query_dict['$and'][0]
+
+    return query_dict if query_dict['$and'] else {}
+
+
+def lowercase(value):
+    """
+    Return value with all strings lowercased, but not regexes, to emulate
+    case insensitive collation that mongomock ignores
+    """
+    if isinstance(value, str):
+        return value.lower()
+
+    if isinstance(value, list):
+        return [lowercase(item) for item in value]
+
+    if isinstance(value, dict):
+        return {k: v if k == '$regex' else lowercase(v) for k, v in value.items()}
+
+    return value
+
+
+class QueryCompilerTest(unittest.TestCase):
+    """
+    Compiled queries match the same samples as before
+    """
+
+    QUERIES = ('campaign=RunIISummer20UL18',
+               'campaign=RunIISummer20UL18,Run3Winter22',
+               'campaign=RunIISummer20UL18,Run3*',
+               'dataset=TTTo*',
+               'dataset=*TTTo*',
+               'dataset=*2Nu*',
+               'dataset=*Tune*P5',
+               'dataset=TTTo2L2Nu_TuneCP5,GluGlu*,QCD_Pt_15',
+               'tags=tagA',
+               'tags=tagA,b',
+               'updated<int>=<5',
+               'updated<int>=5,10',
+               'campaign=!Run3Winter22',
+               'campaign=!Run3Winter22&&dataset=*ttto*',
+               'user=*',
+               'dataset=a.b',
+               'campaign=RunIISummer20UL18&&tags=tagA&&dataset=TTTo*',
+               'dataset=*',
+               'dataset=GluGluToH,ttto2l2nu_tunecp5')
+
+    def setUp(self):
+        campaigns = ['RunIISummer20UL18', 'runiisummer20ul18', 'Run3Winter22', 'X-1']
+        datasets = ['TTTo2L2Nu_TuneCP5', 'ttto2l2nu_tunecp5', 'GluGluToH', 'QCD_Pt_15',
+                    'a.b', 'xTTToy']
+        tags = [[], ['tagA'], ['TagA', 'b']]
+        updated = [1, 5, 10]
+        self.samples = [{'_id': index,
+                         'campaign': campaign,
+                         'dataset': dataset,
+                         'tags': tag_list,
+                         'updated': update,
+                         'user': 'bob'}
+                        for index, (campaign, dataset, tag_list, update)
+                        in enumerate(itertools.product(campaigns, datasets, tags, updated))]
+        self.collection = mongomock.MongoClient().db.samples
+        self.collection.insert_many(self.samples)
+        self.lowercase_collection = mongomock.MongoClient().db.lowercase_samples
+        self.lowercase_collection.insert_many([lowercase(s) for s in self.samples])
+
+    def find_ids(self, query_dict, collation=None):
+        """
+        Return sorted ids of samples that match the filter
+        """
+        if collation:
+            cursor = self.lowercase_collection.find(lowercase(query_dict), {'_id': 1})
+        else:
+            cursor = self.collection.find(query_dict, {'_id': 1})
+
+        return sorted(sample['_id'] for sample in cursor)
+
+    def test_same_samples(self):
+        """
+        Every query matches the same samples as with the previous compiler,
+        both case sensitive and insensitive
+        """
+        for query, ignore_case in itertools.product(self.QUERIES, (False, True)):
+            with self.subTest(query=query, ignore_case=ignore_case):
+                expected = self.find_ids(legacy_compile_query(query, ignore_case))
+                query_dict, collation = compile_query(query, ignore_case)
+                self.assertEqual(self.find_ids(query_dict, collation), expected)
+                # Matrix would not show anything for queries that match nothing
+                self.assertTrue(expected)
+
+    def test_no_match(self):
+        """
+        Query without value can not match anything
+        """
+        self.assertIsNone(compile_query('prepid=', False))
+        self.assertIsNone(compile_query('campaign=X-1&&prepid=', True))
+
+
+if __name__ == '__main__':
+    unittest.main()
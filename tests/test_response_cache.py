@@ -0,0 +1,48 @@
+"""
+Tests of in-memory response cache
+Run with python3 -m unittest discover -s tests -t .
+"""
+import unittest
+from utils.response_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """
+    Entries are dropped when generation moves forward and never go back
+    """
+
+    def setUp(self):
+        self.cache = ResponseCache(1024 * 1024)
+
+    def test_newer_generation(self):
+        """
+        Newer generation drops older entries
+        """
+        self.cache.set('a', (1, 0, 0), 'a')
+        self.cache.set('b', (2, 0, 0), 'b')
+        self.assertIsNone(self.cache.get('a', (2, 0, 0)))
+        self.assertEqual(self.cache.get('b', (2, 0, 0))[0], b'b')
+
+    def test_older_generation(self):
+        """
+        Response of older generation does not replace newer entries
+        """
+        self.cache.set('a', (2, 0, 0), 'a')
+        entry = self.cache.set('b', (1, 0, 0), 'b')
+        self.assertEqual(entry[0], b'b')
+        self.assertEqual(self.cache.generation, (2, 0, 0))
+        self.assertEqual(self.cache.get('a', (2, 0, 0))[0], b'a')
+        self.assertIsNone(self.cache.get('b', (1, 0, 0)))
+
+    def test_partly_older_generation(self):
+        """
+        Generation that missed a change of any collection is older
+        """
+        self.cache.set('a', (2, 1, 0), 'a')
+        self.cache.set('b', (3, 0, 0), 'b')
+        self.assertEqual(self.cache.generation, (2, 1, 0))
+        self.assertEqual(self.cache.get('a', (2, 1, 0))[0], b'a')
+
+
+if __name__ == '__main__':
+    unittest.main()
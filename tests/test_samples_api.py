@@ -0,0 +1,58 @@
+"""
+Tests of samples API helpers
+Run with python3 -m unittest discover -s tests -t .
+"""
+import unittest
+from api.samples_api import GetSamplesAPI
+from utils.utils import get_derived_version
+
+
+class CacheKeyTest(unittest.TestCase):
+    """
+    Cache keys ignore order of values, except order of uploaded names
+    """
+
+    def test_query_order(self):
+        """
+        Order and duplicates of query values do not matter
+        """
+        self.assertEqual(GetSamplesAPI.get_cache_key('a,b', 'x', None, 'd1,d2'),
+                         GetSamplesAPI.get_cache_key('b,a,a', 'x', None, 'd2,d1'))
+
+    def test_upload_order(self):
+        """
+        Report of uploaded names follows their order, so it is in the key
+        """
+        self.assertNotEqual(GetSamplesAPI.get_cache_key('a', None, None, 'd1,d2', upload=True),
+                            GetSamplesAPI.get_cache_key('a', None, None, 'd2,d1', upload=True))
+
+
+class PrepareSampleTest(unittest.TestCase):
+    """
+    Internal attributes are not returned
+    """
+
+    def test_derived_version(self):
+        """
+        Version of derived attributes is used, but not returned
+        """
+        api = GetSamplesAPI()
+        self.assertIn('derived_version', api.get_fields(None)[1])
+        self.assertNotIn('derived_version', api.get_fields(['dataset'])[0])
+        sample = {'_id': '1',
+                  'chained_request': 'HIG-chain_Run3-00001',
+                  'dataset': 'TTTo2L2Nu',
+                  'miniaod': 'HIG-Run3Summer22MiniAODv4-00001',
+                  'nanoaod': 'HIG-Run3Summer22NanoAODv12-00001',
+                  'tags': ['a', 'b'],
+                  'pwgs': ['TOP', 'HIG'],
+                  'derived_version': 'outdated'}
+        sample = api.prepare_sample(sample, frozenset(['a']), get_derived_version())
+        self.assertNotIn('derived_version', sample)
+        self.assertIn('short_name', sample)
+        self.assertEqual(sample['tags'], ['a'])
+        self.assertEqual(sample['pwgs'], ['HIG', 'TOP'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Tests of editing tags and PWGs of samples
+Run with python3 -m unittest discover -s tests -t . (requires tests/requirements.txt)
+"""
+import unittest
+from unittest import mock
+from flask import Flask, g
+from flask_restful import Api
+from api.samples_api import UpdateSampleAPI
+from utils.grasp_database import Database
+from utils.history_writer import HistoryWriter
+from tests import DatabaseTestCase
+
+
+class UpdateSamplesTest(DatabaseTestCase):
+    """
+    History is written only for edits that change samples
+    """
+
+    def setUp(self):
+        super().setUp()
+        Database('tags').bulk_save([{'_id': name, 'name': name} for name in ('a', 'b')])
+        Database('samples').bulk_save([{'_id': f'{root}_{index}',
+                                        'root': root,
+                                        'tags': ['a'],
+                                        'pwgs': ['HIG']}
+                                       for root in ('R1', 'R2') for index in range(2)])
+        self.history = []
+        patcher = mock.patch.object(HistoryWriter, 'add', side_effect=self.history.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app = Flask(__name__)
+        app.before_request(self.set_user)
+        Api(app).add_resource(UpdateSampleAPI, '/api/samples/update')
+        self.client = app.test_client()
+
+    @staticmethod
+    def set_user():
+        """
+        Set user of the request
+        """
+        g.user_info = {'name': 'Bob', 'username': 'bob', 'role': 'user'}
+
+    def update(self, changes):
+        """
+        Post changes and return history entries as (prepid, action, value)
+        """
+        resp = self.client.post('/api/samples/update', json=changes)
+        self.assertTrue(resp.get_json()['success'])
+        return [(e['prepid'], e['action'], e['value']) for e in self.history]
+
+    def test_effective_changes(self):
+        """
+        Changes that add or remove values are written
+        """
+        history = self.update([{'prepid': 'R1', 'action': 'add_tag', 'value': 'b'},
+                               {'prepid': 'R2', 'action': 'remove_pwg', 'value': 'HIG'}])
+        self.assertEqual(history, [('R1', 'add tag', 'b'), ('R2', 'remove pwg', 'HIG')])
+        self.assertEqual(Database('samples').get('R1_0')['tags'], ['a', 'b'])
+
+    def test_no_op_changes(self):
+        """
+        Changes that do not change anything are not written
+        """
+        history = self.update([{'prepid': 'R1', 'action': 'add_tag', 'value': 'a'},
+                               {'prepid': 'R1', 'action': 'remove_tag', 'value': 'b'},
+                               {'prepid': 'R3', 'action': 'add_tag', 'value': 'b'}])
+        self.assertEqual(history, [])
+
+    def test_last_action_wins(self):
+        """
+        Only the applied action of a value is written, once
+        """
+        history = self.update([{'prepid': 'R1', 'action': 'add_tag', 'value': 'b'},
+                               {'prepid': 'R1', 'action': 'remove_tag', 'value': 'b'},
+                               {'prepid': 'R1', 'action': 'remove_tag', 'value': 'a'},
+                               {'prepid': 'R1', 'action': 'remove_tag', 'value': 'a'}])
+        self.assertEqual(history, [('R1', 'remove tag', 'a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+Tests of utility functions
+"""
+import unittest
+from utils.utils import parse_limit
+
+
+class ParseLimitTest(unittest.TestCase):
+    """
+    Page size arguments are clamped and validated
+    """
+
+    def test_default(self):
+        """
+        Default is used when limit is not given
+        """
+        self.assertEqual(parse_limit(None, 1000, 25000), 1000)
+
+    def test_clamp(self):
+        """
+        Limits are clamped to 1..maximum, 0 must not mean no limit
+        """
+        self.assertEqual(parse_limit('50', 1000, 25000), 50)
+        self.assertEqual(parse_limit('0', 1000, 25000), 1)
+        self.assertEqual(parse_limit('-5', 1000, 25000), 1)
+        self.assertEqual(parse_limit('1000000', 1000, 25000), 25000)
+
+    def test_invalid(self):
+        """
+        Non integer limit is an error
+        """
+        with self.assertRaises(ValueError):
+            parse_limit('abc', 1000, 25000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Module reports missing and unused indexes of GrASP collections
+"""
+import argparse
+import logging
+import os
+from utils.grasp_database import Database as GrASPDatabase
+
+logger = logging.getLogger()
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description="GrASP database index report")
+    parser.add_argument("--db_auth", help="Path to GrASP database auth file")
+    parser.add_argument("--debug", help="Enable debug logs", action="store_true")
+    parser.add_argument("--create", help="Create missing indexes", action="store_true")
+    args = vars(parser.parse_args())
+    debug = args.get("debug")
+    logging.basicConfig(
+        format="[%(asctime)s][%(levelname)s] %(message)s",
+        level=logging.DEBUG if debug else logging.INFO,
+    )
+    db_auth = args.get("db_auth")
+    create = args.get("create")
+    logger.debug("db_auth=%s, create=%s, debug=%s", db_auth, create, debug)
+    GrASPDatabase.set_database_name("grasp")
+    if db_auth:
+        GrASPDatabase.set_credentials_file(db_auth)
+    else:
+        # Retrieve credentials from environment variables
+        db_username = os.getenv("DB_USERNAME")
+        db_password = os.getenv("DB_PASSWORD")
+        GrASPDatabase.set_credentials(username=db_username, password=db_password)
+
+    for collection_name in GrASPDatabase.INDEXES:
+        database = GrASPDatabase(collection_name)
+        report = database.index_report()
+        logger.info(
+            "%s: missing %s, unlisted %s, unused %s",
+            collection_name,
+            ", ".join(report["missing"]) or "-",
+            ", ".join(report["unlisted"]) or "-",
+            ", ".join(report["unused"]) or "-",
+        )
+        if create and report["missing"]:
+            database.ensure_indexes()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ import os
 from rest import McM
 from utils.grasp_database import Database as GrASPDatabase
 from utils.mcm_database import Database as McMDatabase
-from utils.utils import chained_request_to_steps
+from utils.utils import chained_request_to_steps, add_derived_fields
 
 logger = logging.getLogger()
 
@@ -21,7 +21,7 @@ class SampleUpdater:
     Samples updater
     """
 
-    def __init__(self, dev, debug):
+    def __init__(self, dev, debug, dry_run=False, max_cleanup_fraction=0.5):
         self.mcm = McM(dev=dev)
         self.debug = debug
         self.mcm_request_db = McMDatabase("requests", dev=dev)
@@ -31,6 +31,12 @@ class SampleUpdater:
         self.update_timestamp = int(time.time())
         self.updated_prepids = set()
         self.cache = {}
+        # Samples of current root request waiting to be written to the database
+        self.pending_samples = []
+        # Do not delete anything in cleanup, only report
+        self.dry_run = dry_run
+        # Abort cleanup if larger fraction of samples would be deleted
+        self.max_cleanup_fraction = max_cleanup_fraction
 
     def get_mcm_request(self, prepid, use_cache=True):
         """
@@ -276,6 +282,7 @@ class SampleUpdater:
                 "ref_pwgs": pwgs,
                 "updated": self.update_timestamp,
             }
+            add_derived_fields(entry)
 
             if existing_sample:
                 entry["_id"] = existing_sample["_id"]
@@ -286,7 +293,7 @@ class SampleUpdater:
             else:
                 entry["_id"] = self.entry_hash(entry)
 
-            self.sample_db.save(entry)
+            self.pending_samples.append(entry)
             if root_prepid:
                 self.updated_prepids.add(root_prepid)
 
@@ -296,7 +303,22 @@ class SampleUpdater:
             if nanoaod_prepid:
                 self.updated_prepids.add(nanoaod_prepid)
 
-            time.sleep(0.01)
+        # Samples are written right after their tags and PWGs were read, so
+        # edits made in the meantime are not overwritten
+        self.flush_samples()
+
+    def flush_samples(self):
+        """
+        Write all pending samples to the database in one bulk write
+        """
+        if not self.pending_samples:
+            return
+
+        logger.info("Saving %s samples", len(self.pending_samples))
+        self.sample_db.bulk_save(self.pending_samples)
+        self.pending_samples = []
+        # Let readers know that samples changed
+        self.sample_db.bump_generation()
 
     def update_campaigns(self):
         """
@@ -305,7 +327,7 @@ class SampleUpdater:
         campaign_db = GrASPDatabase("campaigns")
         count = campaign_db.get_count()
         logger.debug("Campaign count - %s", count)
-        campaigns = [c["name"] for c in campaign_db.query(limit=count)]
+        campaigns = [c["name"] for c in campaign_db.query(limit=count, fields=["name"])]
         logger.debug("Campaigns: %s", ", ".join(campaigns))
         self.update_requests({"member_of_campaign": campaigns})
 
@@ -316,7 +338,7 @@ class SampleUpdater:
         tag_db = GrASPDatabase("tags")
         count = tag_db.get_count()
         logger.debug("Tag count - %s", count)
-        tags = [t["name"] for t in tag_db.query(limit=count)]
+        tags = [t["name"] for t in tag_db.query(limit=count, fields=["name"])]
         logger.debug("Tags: %s", ", ".join(tags))
         self.update_requests({"tags": tags})
 
@@ -355,19 +377,37 @@ class SampleUpdater:
     def cleanup(self):
         """
         Remove all entries that have lower updated than update_timestamp
+        Nothing is removed if it would remove more than max_cleanup_fraction
+        of all entries, e.g. if update failed to fetch requests from McM
         """
         sample_db = GrASPDatabase("samples")
         logger.info("Cleaning up")
-        samples = [{}]
-        deleted = 0
-        while samples:
-            samples = sample_db.query(
-                f"updated<int>=<{self.update_timestamp}", limit=50
+        query = f"updated<int>=<{self.update_timestamp}"
+        stale = sample_db.count_by(query, "campaign")
+        stale_count = sum(stale.values())
+        total_count = sample_db.get_count()
+        for campaign, count in sorted(stale.items(), key=lambda x: str(x[0])):
+            logger.info("Stale samples in %s: %s", campaign, count)
+
+        logger.info("Stale samples: %s out of %s", stale_count, total_count)
+        if not stale_count:
+            return
+
+        if stale_count > total_count * self.max_cleanup_fraction:
+            logger.error(
+                "Aborting cleanup, %s of %s samples would be deleted, limit is %.0f%%",
+                stale_count,
+                total_count,
+                self.max_cleanup_fraction * 100,
             )
-            for sample in samples:
-                sample_db.delete_document(sample)
-                deleted += 1
+            return
+
+        if self.dry_run:
+            logger.info("Dry run, not deleting anything")
+            return
 
+        deleted = sample_db.delete_query(query)
+        sample_db.bump_generation()
         logger.info("Deleted %s", deleted)
 
 
@@ -379,6 +419,15 @@ def main():
     parser.add_argument("--db_auth", help="Path to GrASP database auth file")
     parser.add_argument("--debug", help="Enable debug logs", action="store_true")
     parser.add_argument("--dev", help="Use McM-Dev", action="store_true")
+    parser.add_argument(
+        "--dry_run", help="Only report samples to clean up", action="store_true"
+    )
+    parser.add_argument(
+        "--max_cleanup_fraction",
+        help="Abort cleanup if larger fraction of samples is stale, default is 0.5",
+        type=float,
+        default=0.5,
+    )
     args = vars(parser.parse_args())
     debug = args.get("debug")
     logging.basicConfig(
@@ -397,10 +446,20 @@ def main():
         db_password = os.getenv("DB_PASSWORD")
         GrASPDatabase.set_credentials(username=db_username, password=db_password)
 
-    updater = SampleUpdater(dev=dev, debug=debug)
-    updater.update_campaigns()
-    updater.update_tags()
-    updater.cleanup()
+    GrASPDatabase.ensure_all_indexes()
+    updater = SampleUpdater(
+        dev=dev,
+        debug=debug,
+        dry_run=args.get("dry_run"),
+        max_cleanup_fraction=args.get("max_cleanup_fraction"),
+    )
+    try:
+        updater.update_campaigns()
+        updater.update_tags()
+        updater.cleanup()
+    finally:
+        # Samples might have been written before a failure
+        updater.sample_db.bump_generation()
 
 
 if __name__ == "__main__":
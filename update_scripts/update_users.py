@@ -25,11 +25,14 @@ class UserUpdater:
         """
         logger.info("Updating users")
         for users in self.mcm_user_db.bulk_yield(100):
+            entries = []
             for user in users:
                 username = user["username"]
                 role = user["role"]
                 logger.info("Updating %s (%s)", username, role)
-                self.user_db.save({"_id": username, "username": username, "role": role})
+                entries.append({"_id": username, "username": username, "role": role})
+
+            self.user_db.bulk_save(entries)
 
 
 def main():
@@ -58,6 +61,7 @@ def main():
         db_password = os.getenv("DB_PASSWORD")
         GrASPDatabase.set_credentials(username=db_username, password=db_password)
 
+    GrASPDatabase.ensure_all_indexes()
     UserUpdater(dev=dev).update()
 
 
@@ -1,12 +1,18 @@
 """
 A module that handles all communication with MongoDB
 """
+import base64
 import logging
 import time
 import json
 import os
 import re
-from pymongo import MongoClient, ASCENDING, DESCENDING
+import threading
+from cachelib import SimpleCache
+from pymongo import MongoClient, IndexModel, ReplaceOne, UpdateMany, DeleteOne, ReturnDocument
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from utils.query_compiler import compile_query, can_use_collation, CASE_INSENSITIVE
 
 
 class Database():
@@ -19,6 +25,47 @@ class Database():
     DATABASE_NAME = None
     USERNAME = None
     PASSWORD = None
+    MAX_POOL_SIZE = 100
+    MIN_POOL_SIZE = 0
+    # Shared MongoClient objects of this process, keyed by host, port and credentials
+    clients = {}
+    clients_pid = None
+    clients_lock = threading.Lock()
+    # Queries that take longer than this number of seconds are logged
+    SLOW_QUERY_THRESHOLD = 1.0
+    SLOW_QUERY_EXPLAIN = False
+    # Recent query counts, keyed by collection and query string
+    COUNT_CACHE_TIMEOUT = 60
+    count_cache = SimpleCache(threshold=1000)
+    # Collection with change generation of each collection
+    GENERATIONS_COLLECTION = 'generations'
+    # Error code of inserting a document with existing _id
+    DUPLICATE_KEY_ERROR = 11000
+    # Indexes of each collection, in addition to the default _id index
+    # Tags, campaigns and users are looked up only by _id
+    INDEXES = {
+        'samples': [[('root', ASCENDING)],
+                    [('campaign', ASCENDING)],
+                    [('tags', ASCENDING)],
+                    [('pwgs', ASCENDING)],
+                    [('dataset', ASCENDING), ('_id', ASCENDING)],
+                    [('updated', ASCENDING)]],
+        'history': [[('user', ASCENDING), ('time', DESCENDING), ('_id', DESCENDING)],
+                    [('time', DESCENDING), ('_id', DESCENDING)]],
+        'users': [],
+        'tags': [],
+        'campaigns': [],
+    }
+    # Indexes with case insensitive collation for queries that ignore case
+    # Collation applies to all equalities of a query, so every attribute that
+    # can be in such query needs one
+    COLLATED_INDEXES = {
+        'samples': [[('root', ASCENDING)],
+                    [('campaign', ASCENDING)],
+                    [('tags', ASCENDING)],
+                    [('pwgs', ASCENDING)],
+                    [('dataset', ASCENDING), ('_id', ASCENDING)]],
+    }
 
     def __init__(self, collection_name=None):
         """
@@ -26,25 +73,70 @@ class Database():
         """
         self.collection_name = collection_name
         self.logger = logging.getLogger()
-        db_host = os.environ.get('DB_HOST', Database.DATABASE_HOST)
-        db_port = int(os.environ.get('DB_PORT', Database.DATABASE_PORT))
         if not Database.DATABASE_NAME:
             raise ValueError('Database name is not set')
 
-        if Database.USERNAME and Database.PASSWORD:
-            self.logger.debug('Using DB with username and password. DB: %s', collection_name)
-            self.client = MongoClient(db_host,
-                                      db_port,
-                                      username=Database.USERNAME,
-                                      password=Database.PASSWORD,
-                                      authSource='admin',
-                                      authMechanism='SCRAM-SHA-256')[Database.DATABASE_NAME]
-        else:
-            self.logger.debug('Using DB without username and password')
-            self.client = MongoClient(db_host, db_port)[Database.DATABASE_NAME]
-
+        self.client = Database.get_client()[Database.DATABASE_NAME]
         self.collection = self.client[collection_name]
 
+    @classmethod
+    def get_client(cls):
+        """
+        Return a MongoClient shared by all Database objects of this process
+        Clients are not fork-safe, so clients inherited from a parent process
+        are dropped and new ones are created
+        """
+        db_host = os.environ.get('DB_HOST', cls.DATABASE_HOST)
+        db_port = int(os.environ.get('DB_PORT', cls.DATABASE_PORT))
+        max_pool_size = int(os.environ.get('DB_MAX_POOL_SIZE', cls.MAX_POOL_SIZE))
+        min_pool_size = int(os.environ.get('DB_MIN_POOL_SIZE', cls.MIN_POOL_SIZE))
+        key = (db_host, db_port, cls.USERNAME, cls.PASSWORD)
+        with cls.clients_lock:
+            pid = os.getpid()
+            if cls.clients_pid != pid:
+                cls.clients = {}
+                cls.clients_pid = pid
+
+            client = cls.clients.get(key)
+            if client is not None:
+                return client
+
+            logger = logging.getLogger()
+            options = {'maxPoolSize': max_pool_size,
+                       'minPoolSize': min_pool_size,
+                       'connect': False}
+            if cls.USERNAME and cls.PASSWORD:
+                logger.debug('Creating DB client with username and password. %s:%s',
+                             db_host,
+                             db_port)
+                client = MongoClient(db_host,
+                                     db_port,
+                                     username=cls.USERNAME,
+                                     password=cls.PASSWORD,
+                                     authSource='admin',
+                                     authMechanism='SCRAM-SHA-256',
+                                     **options)
+            else:
+                logger.debug('Creating DB client without username and password. %s:%s',
+                             db_host,
+                             db_port)
+                client = MongoClient(db_host, db_port, **options)
+
+            cls.clients[key] = client
+            return client
+
+    @classmethod
+    def close_clients(cls):
+        """
+        Close all shared clients of this process
+        """
+        with cls.clients_lock:
+            if cls.clients_pid == os.getpid():
+                for client in cls.clients.values():
+                    client.close()
+
+            cls.clients = {}
+
     @staticmethod
     def set_host_port(host, port):
         """
@@ -53,6 +145,14 @@ class Database():
         Database.DATABASE_HOST = host
         Database.DATABASE_PORT = port
 
+    @staticmethod
+    def set_pool_size(max_pool_size, min_pool_size=0):
+        """
+        Set maximum and minimum number of connections in each client's pool
+        """
+        Database.MAX_POOL_SIZE = max_pool_size
+        Database.MIN_POOL_SIZE = min_pool_size
+
     @staticmethod
     def set_database_name(database_name):
         """
@@ -78,6 +178,62 @@ class Database():
 
         Database.set_credentials(credentials['username'], credentials['password'])
 
+    @staticmethod
+    def index_name(keys, collated=False):
+        """
+        Return name of an index with given keys
+        Names of indexes with case insensitive collation end with _ci
+        """
+        name = '_'.join(f'{key}_{direction}' for key, direction in keys)
+        return f'{name}_ci' if collated else name
+
+    def get_index_models(self):
+        """
+        Return IndexModel objects of all indexes of this collection
+        """
+        models = [IndexModel(keys, name=Database.index_name(keys))
+                  for keys in Database.INDEXES.get(self.collection_name, [])]
+        models += [IndexModel(keys,
+                              name=Database.index_name(keys, True),
+                              collation=CASE_INSENSITIVE)
+                   for keys in Database.COLLATED_INDEXES.get(self.collection_name, [])]
+        return models
+
+    def ensure_indexes(self):
+        """
+        Create indexes of this collection that are listed in INDEXES and
+        COLLATED_INDEXES
+        Existing indexes are left untouched
+        """
+        models = self.get_index_models()
+        if not models:
+            return []
+
+        self.logger.info('Ensuring %s indexes in "%s"', len(models), self.collection_name)
+        return self.collection.create_indexes(models)
+
+    @classmethod
+    def ensure_all_indexes(cls):
+        """
+        Create indexes of all collections that are listed in INDEXES
+        """
+        for collection_name in cls.INDEXES:
+            cls(collection_name).ensure_indexes()
+
+    def index_report(self):
+        """
+        Return names of indexes that are listed in INDEXES but do not exist,
+        indexes that exist but are not listed and indexes that were not used
+        since the server was started
+        """
+        expected = [model.document['name'] for model in self.get_index_models()]
+        existing = [name for name in self.collection.index_information() if name != '_id_']
+        usage = self.collection.aggregate([{'$indexStats': {}}])
+        unused = [i['name'] for i in usage if i['name'] != '_id_' and not i['accesses']['ops']]
+        return {'missing': sorted(set(expected) - set(existing)),
+                'unlisted': sorted(set(existing) - set(expected)),
+                'unused': sorted(unused)}
+
     def get_count(self):
         """
         Get number of documents in the database
@@ -117,6 +273,27 @@ class Database():
 
         return self.collection.delete_one({'_id': document_id})
 
+    def delete_query(self, query_string, ignore_case=False):
+        """
+        Delete all documents that match the query in a single request
+        Return number of deleted documents
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return 0
+
+        query_dict, collation = compiled_query
+        if not query_dict:
+            raise ValueError('Refusing to delete all documents')
+
+        self.logger.debug('Deleting %s in "%s"', query_dict, self.collection_name)
+        if collation:
+            result = self.collection.delete_many(query_dict, collation=collation)
+        else:
+            result = self.collection.delete_many(query_dict)
+
+        return result.deleted_count
+
     def save(self, document):
         """
         Save a document
@@ -131,138 +308,614 @@ class Database():
             return False
 
         document['last_update'] = int(time.time())
-        if self.document_exists(document_id):
-            self.logger.debug('Updating %s', document_id)
-            return self.collection.replace_one({'_id': document_id}, document)
+        self.logger.debug('Saving %s', document_id)
+        return self.collection.replace_one({'_id': document_id}, document, upsert=True)
 
-        self.logger.debug('Creating %s', document_id)
-        return self.collection.insert_one(document)
+    def bulk_save(self, documents):
+        """
+        Save multiple documents in a single unordered bulk write
+        """
+        last_update = int(time.time())
+        operations = []
+        for document in documents:
+            if not isinstance(document, dict):
+                self.logger.error('%s is not a dictionary', document)
+                continue
 
-    def query(self,
-              query_string=None,
-              page=0, limit=20,
-              sort_attr=None, sort_asc=True,
-              ignore_case=False):
-        """
-        Same as query_with_total_rows, but return only list of objects
-        """
-        return self.query_with_total_rows(query_string,
-                                          page,
-                                          limit,
-                                          sort_attr,
-                                          sort_asc,
-                                          ignore_case)[0]
-
-    def get_value_condition(self, value):
-        """
-        Get a condition from value and return value and condition separately
-        """
-        value_condition = None
-        if '<' in value[0]:
-            value_condition = '$lt'
-            value = value[1:]
-        elif value[0] == '>':
-            value_condition = '$gt'
-            value = value[1:]
-        elif value[0] == '!':
-            value_condition = '$ne'
-            value = value[1:]
-
-        self.logger.debug('Value: %s, condition: %s', value, value_condition)
-        return value, value_condition
-
-    def get_value_query(self, key, values, ignore_case=False):
-        """
-        Check for < > and ! in front of values, handle OR operation, use correct attribute type
-        """
-        value_or = []
-        for value in values:
-            value, value_condition = self.get_value_condition(value.strip())
-            if '<int>' in key:
-                value = int(value)
-                if value_condition:
-                    value = {value_condition: value}
-
-                value_or.append({key.replace('<int>', ''): value})
-            elif '<float>' in key:
-                value = float(value)
-                if value_condition:
-                    value = {value_condition: value}
-
-                value_or.append({key.replace('<float>', ''): value})
-            elif '<bool>' in key:
-                value = bool(value.lower() in ('true', 'yes'))
-                if value_condition:
-                    value = {value_condition: value}
-
-                value_or.append({key.replace('<bool>', ''): value})
-            else:
-                if value_condition:
-                    value = {value_condition: value}
-                    value_or.append({key: value})
-                else:
-                    if '*' in value:
-                        if ignore_case:
-                            value = re.compile(f'^{value}$', re.IGNORECASE)
+            document_id = document.get('_id', '')
+            if not document_id:
+                self.logger.error('%s does not have a _id', document)
+                continue
+
+            document['last_update'] = last_update
+            operations.append(ReplaceOne({'_id': document_id}, document, upsert=True))
+
+        if not operations:
+            return None
+
+        self.logger.debug('Saving %s documents in "%s"', len(operations), self.collection_name)
+        return self.collection.bulk_write(operations, ordered=False)
+
+    def bulk_insert(self, documents):
+        """
+        Insert multiple new documents in a single unordered write
+        Documents whose _id already exists are skipped
+        Return number of inserted documents
+        """
+        last_update = int(time.time())
+        for document in documents:
+            document['last_update'] = last_update
+
+        if not documents:
+            return 0
 
-                        value_or.append({key: {'$regex': value}})
-                    else:
-                        if ignore_case:
-                            value = re.compile(f'^{value}$', re.IGNORECASE)
+        self.logger.debug('Inserting %s documents in "%s"', len(documents), self.collection_name)
+        try:
+            return len(self.collection.insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as ex:
+            errors = ex.details.get('writeErrors', [])
+            if any(error.get('code') != Database.DUPLICATE_KEY_ERROR for error in errors):
+                raise
 
-                        value_or.append({key: value})
+            return ex.details.get('nInserted', 0)
 
-        self.logger.debug('Key: %s, values: %s, query: %s', key, values, value_or)
-        if len(value_or) > 1:
-            return {'$or': value_or}
+    def bulk_update(self, updates):
+        """
+        Apply multiple (filter, update) pairs to all matching documents in a
+        single unordered bulk write, last_update is set in every update
+        """
+        last_update = int(time.time())
+        operations = []
+        for query_filter, update in updates:
+            update = dict(update)
+            update['$set'] = dict(update.get('$set', {}), last_update=last_update)
+            operations.append(UpdateMany(query_filter, update))
+
+        if not operations:
+            return None
 
-        if len(value_or) == 1:
-            return value_or[0]
+        self.logger.debug('Updating %s filters in "%s"', len(operations), self.collection_name)
+        return self.collection.bulk_write(operations, ordered=False)
 
-        return None
+    def bulk_delete(self, document_ids):
+        """
+        Delete multiple documents by their ids in a single unordered bulk write
+        """
+        operations = [DeleteOne({'_id': document_id}) for document_id in document_ids]
+        if not operations:
+            return None
+
+        self.logger.debug('Deleting %s documents in "%s"', len(operations), self.collection_name)
+        return self.collection.bulk_write(operations, ordered=False)
+
+    def query(self,
+              query_string=None,
+              page=0, limit=20,
+              sort_attr=None, sort_asc=True,
+              ignore_case=False,
+              fields=None):
+        """
+        Same as query_with_total_rows, but return only list of objects and do
+        not count rows
+        """
+        query = self.prepare_query(query_string,
+                                   page,
+                                   limit,
+                                   sort_attr,
+                                   sort_asc,
+                                   ignore_case,
+                                   fields)
+        if query is None:
+            return []
+
+        return self.fetch(query)
 
     def query_with_total_rows(self,
                               query_string=None,
                               page=0, limit=20,
                               sort_attr=None, sort_asc=True,
-                              ignore_case=False):
+                              ignore_case=False,
+                              cached_count=False,
+                              fields=None):
         """
         Perform a query in a database
         And operator is &&
         Example prepid=*19*&&is_root=false
+        Return list of objects in the page and total number of matching objects
+        If fields are given, objects contain only these attributes
+        """
+        query = self.prepare_query(query_string,
+                                   page,
+                                   limit,
+                                   sort_attr,
+                                   sort_asc,
+                                   ignore_case,
+                                   fields)
+        if query is None:
+            return [], 0
+
+        results = self.fetch(query)
+        if len(results) < limit and (results or page == 0):
+            # This is the last page, so there is no need to count
+            return results, page * limit + len(results)
+
+        total_rows = self.count(query_string, ignore_case, cached_count)
+        return results, int(total_rows)
+
+    def iterate(self,
+                query_string=None,
+                batch_size=100,
+                fields=None,
+                sort_attr=None, sort_asc=True,
+                ignore_case=False,
+                limit=0,
+                allow_disk_use=False):
+        """
+        Yield objects that match the query one by one
+        Objects are fetched from the database in batches of batch_size, so
+        only one batch is kept in memory at a time
+        Limit 0 means no limit
+        Sort attribute may be a list of attributes, allow_disk_use lets the
+        database sort more objects than fit in its sort memory limit
+        """
+        query = self.prepare_query(query_string,
+                                   0,
+                                   limit,
+                                   sort_attr,
+                                   sort_asc,
+                                   ignore_case,
+                                   fields)
+        if query is None:
+            return
+
+        query['allow_disk_use'] = allow_disk_use
+
+        # Measure only the time spent waiting for the database
+        duration = 0
+        returned = 0
+        cursor = self.open_cursor(query).batch_size(batch_size)
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    document = next(cursor)
+                except StopIteration:
+                    break
+                finally:
+                    duration += time.time() - start_time
+
+                returned += 1
+                yield document
+        finally:
+            cursor.close()
+            self.log_slow_query(query, duration, returned)
+
+    def query_page(self,
+                   query_string=None,
+                   limit=20,
+                   sort_attr=None, sort_asc=True,
+                   ignore_case=False,
+                   fields=None,
+                   after=None):
+        """
+        Perform a query using keyset pagination
+        Return list of objects and an opaque token that should be passed as
+        "after" to get the next page, token is None if this is the last page
+        Objects are sorted by sort attribute and then by _id
         """
-        query_dict = {'$and': []}
-        if query_string:
-            query_string_parts = [x for x in query_string.split('&&') if x.strip()]
-            self.logger.debug('Query parts %s', query_string_parts)
-            for part in query_string_parts:
-                split_part = part.split('=')
-                key = split_part[0].strip()
-
-                values = split_part[1].strip().replace('**', '*').replace('*', '.*')
-                values = [value.strip() for value in values.split(',') if value.strip()]
-                if not values:
-                    # If no value is given, then no results will be returned
-                    # For example "prepid=" shou return nothing
-                    return [], 0
-
-                value_query = self.get_value_query(key, values, ignore_case)
-                if value_query:
-                    query_dict['$and'].append(value_query)
-
-        if len(query_dict['$and']) == 1:
-            query_dict = query_dict['$and'][0]
-        elif not query_dict['$and']:
-            query_dict = {}
+        sort_attr = Database.clean_sort_attr(sort_attr)
+        after = Database.decode_page_token(after, sort_attr, sort_asc) if after else None
+        query_fields = None
+        if fields:
+            query_fields = list(dict.fromkeys(list(fields) + [sort_attr, '_id']))
+
+        query = self.prepare_query(query_string,
+                                   0,
+                                   limit,
+                                   sort_attr,
+                                   sort_asc,
+                                   ignore_case,
+                                   query_fields,
+                                   after)
+        if query is None:
+            return [], None
+
+        results = self.fetch(query)
+        token = None
+        if results and len(results) == limit:
+            last = results[-1]
+            token = Database.encode_page_token(last.get(sort_attr),
+                                               last['_id'],
+                                               sort_attr,
+                                               sort_asc)
+
+        if fields:
+            results = [{k: v for k, v in r.items() if k in fields} for r in results]
+
+        return results, token
+
+    def query_in(self,
+                 attribute,
+                 values,
+                 query_string=None,
+                 ignore_case=False,
+                 fields=None,
+                 chunk_size=1000,
+                 limit=0):
+        """
+        Yield objects that match the query and whose attribute is equal to
+        one of values
+        Values are looked up with $in in chunks of chunk_size, so filters stay
+        small, can use the index of the attribute and do not fill the cache of
+        compiled queries
+        If ignore_case is set, values are compared using case insensitive
+        collation or, same as in compiled queries, with case insensitive
+        regexes if the query has conditions that collation would change
+        Limit 0 means no limit
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return
+
+        query_dict, collation = compiled_query
+        use_regex = False
+        if ignore_case and can_use_collation(query_string):
+            collation = CASE_INSENSITIVE
+        elif ignore_case:
+            use_regex = True
+
+        projection = Database.get_projection(fields)
+        returned = 0
+        for start in range(0, len(values), chunk_size):
+            chunk = list(values[start:start + chunk_size])
+            if use_regex:
+                chunk = [re.compile(f'^{re.escape(value)}$', re.IGNORECASE) for value in chunk]
+
+            in_dict = {attribute: {'$in': chunk}}
+            query = {'filter': {'$and': [query_dict, in_dict]} if query_dict else in_dict,
+                     'projection': projection,
+                     'collation': collation,
+                     'limit': limit - returned if limit else 0}
+            for document in self.fetch(query):
+                returned += 1
+                yield document
+
+            if limit and returned >= limit:
+                return
 
+    @staticmethod
+    def clean_sort_attr(sort_attr):
+        """
+        Return sort attribute without type, _id if it is not set
+        """
         if not sort_attr:
-            sort_attr = '_id'
+            return '_id'
+
+        return sort_attr.replace('<int>', '').replace('<float>', '').replace('<bool>', '')
+
+    @staticmethod
+    def encode_page_token(value, document_id, sort_attr, sort_asc):
+        """
+        Return opaque token of position after given value and id
+        """
+        token = json.dumps([sort_attr, sort_asc, value, document_id])
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('utf-8')
+
+    @staticmethod
+    def decode_page_token(token, sort_attr, sort_asc):
+        """
+        Return value and id from a token
+        Raise ValueError if token is invalid or was made for a different sort
+        """
+        try:
+            token = json.loads(base64.urlsafe_b64decode(token.encode('utf-8')))
+            token_attr, token_asc, value, document_id = token
+        except Exception as ex:
+            raise ValueError('Invalid page token') from ex
+
+        if token_attr != sort_attr or token_asc != sort_asc:
+            raise ValueError('Page token does not match sorting')
+
+        return value, document_id
+
+    def prepare_query(self,
+                      query_string=None,
+                      page=0, limit=20,
+                      sort_attr=None, sort_asc=True,
+                      ignore_case=False,
+                      fields=None,
+                      after=None):
+        """
+        Return a dictionary with filter, projection, sort, collation, skip and
+        limit of a query or None if query can not match anything
+        Query strings are compiled and cached by utils.query_compiler
+        Objects are sorted by sort attribute (or a list of attributes) and
+        then by _id
+        If after is a (value, _id) tuple, return only objects after it, this
+        works only with a single sort attribute
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return None
+
+        query_dict, collation = compiled_query
+        sort_attrs = sort_attr if isinstance(sort_attr, (list, tuple)) else [sort_attr]
+        sort_attrs = [Database.clean_sort_attr(attr) for attr in sort_attrs]
+        if after and len(sort_attrs) > 1:
+            raise ValueError('Pages can be sorted by only one attribute')
+
+        sort_attr = sort_attrs[0]
+        direction = ASCENDING if sort_asc else DESCENDING
+        sort = [(attr, direction) for attr in sort_attrs]
+        if '_id' not in sort_attrs:
+            sort.append(('_id', direction))
+
+        if after:
+            operator = '$gt' if sort_asc else '$lt'
+            value, document_id = after
+            if sort_attr == '_id':
+                after_dict = {'_id': {operator: document_id}}
+            else:
+                after_dict = {'$or': [{sort_attr: {operator: value}},
+                                      {sort_attr: value, '_id': {operator: document_id}}]}
+
+            # Compiled query is cached, so it must not be modified
+            query_dict = {'$and': [query_dict, after_dict]} if query_dict else after_dict
 
-        sort_attr = sort_attr.replace('<int>', '').replace('<float>', '').replace('<bool>', '')
         self.logger.debug('Database "%s" query dict %s', self.collection_name, query_dict)
-        self.logger.debug('Sorting on %s ascending %s', sort_attr, 'YES' if sort_asc else 'NO')
-        result = self.collection.find(query_dict)
-        result = result.sort(sort_attr, ASCENDING if sort_asc else DESCENDING)
-        total_rows = 0 # result.count()
-        result = result.skip(page * limit).limit(limit)
-        return list(result), int(total_rows)
+        self.logger.debug('Sorting on %s ascending %s',
+                          ', '.join(sort_attrs),
+                          'YES' if sort_asc else 'NO')
+        return {'filter': query_dict,
+                'projection': Database.get_projection(fields),
+                'sort': sort,
+                'collation': collation,
+                'skip': page * limit,
+                'limit': limit}
+
+    def open_cursor(self, query):
+        """
+        Return a cursor for a prepared query
+        """
+        cursor = self.collection.find(query['filter'],
+                                      query.get('projection'),
+                                      collation=query.get('collation'))
+        if query.get('sort'):
+            cursor = cursor.sort(query['sort'])
+
+        if query.get('allow_disk_use'):
+            cursor = cursor.allow_disk_use(True)
+
+        return cursor.skip(query.get('skip', 0)).limit(query.get('limit', 0))
+
+    def fetch(self, query):
+        """
+        Return list of all objects of a prepared query
+        """
+        start_time = time.time()
+        results = list(self.open_cursor(query))
+        self.log_slow_query(query, time.time() - start_time, len(results))
+        return results
+
+    @staticmethod
+    def set_slow_query_log(threshold, explain=False):
+        """
+        Set number of seconds after which queries are logged as slow and
+        whether their query plan should be logged too
+        """
+        Database.SLOW_QUERY_THRESHOLD = threshold
+        Database.SLOW_QUERY_EXPLAIN = explain
+
+    def log_slow_query(self, query, duration, returned):
+        """
+        Log query if it took longer than the slow query threshold
+        """
+        threshold = Database.SLOW_QUERY_THRESHOLD
+        if threshold is None or duration < threshold:
+            return
+
+        plan = ''
+        if Database.SLOW_QUERY_EXPLAIN:
+            try:
+                explain = self.open_cursor(query).explain()
+                plan = Database.summarize_plan(explain['queryPlanner']['winningPlan'])
+            except Exception as ex:
+                plan = f'explain failed: {ex}'
+
+        self.logger.warning('Slow query in "%s" %.4fs: filter %s, sort %s, collation %s, '
+                            'returned %s%s',
+                            self.collection_name,
+                            duration,
+                            query['filter'],
+                            query.get('sort'),
+                            query.get('collation'),
+                            returned,
+                            f', plan {plan}' if plan else '')
+
+    @staticmethod
+    def summarize_plan(plan):
+        """
+        Return a short description of a query plan, e.g.
+        LIMIT <- FETCH <- IXSCAN(campaign_1) or SORT <- COLLSCAN
+        """
+        stages = []
+        while plan:
+            stage = plan.get('stage', '?')
+            if plan.get('indexName'):
+                stage += f'({plan["indexName"]})'
+
+            stages.append(stage)
+            plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+
+        return ' <- '.join(stages)
+
+    def count_by(self, query_string, attribute, ignore_case=False):
+        """
+        Return dictionary of attribute values and numbers of documents that
+        match the query and have these values
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return {}
+
+        query_dict, collation = compiled_query
+        pipeline = [{'$match': query_dict},
+                    {'$group': {'_id': f'${attribute}', 'count': {'$sum': 1}}}]
+        if collation:
+            result = self.collection.aggregate(pipeline, collation=collation)
+        else:
+            result = self.collection.aggregate(pipeline)
+
+        return {r['_id']: r['count'] for r in result}
+
+    def distinct_combinations(self, attributes, query_string=None, ignore_case=False):
+        """
+        Return list of dictionaries with distinct combinations of values of
+        given attributes in documents that match the query
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return []
+
+        query_dict, collation = compiled_query
+        pipeline = [{'$match': query_dict},
+                    {'$group': {'_id': {attr: f'${attr}' for attr in attributes}}}]
+        options = {'allowDiskUse': True}
+        if collation:
+            options['collation'] = collation
+
+        return [r['_id'] for r in self.collection.aggregate(pipeline, **options)]
+
+    def summarize(self,
+                  query_string,
+                  group_by,
+                  sum_fields=None,
+                  ignore_case=False,
+                  array_values=None):
+        """
+        Return list of dictionaries with distinct combinations of values of
+        group_by attributes in documents that match the query, number of these
+        documents ("count") and sums of sum_fields
+        array_values is a dictionary of array attributes in group_by and their
+        allowed values (None for all values), each value of these arrays makes
+        a separate group and documents without allowed values get None
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return []
+
+        query_dict, collation = compiled_query
+        sum_fields = list(sum_fields or [])
+        pipeline = [{'$match': query_dict},
+                    {'$project': {attr: True for attr in list(group_by) + sum_fields}}]
+        for attr, allowed in (array_values or {}).items():
+            if attr not in group_by:
+                continue
+
+            if allowed is not None:
+                values = {'$filter': {'input': {'$ifNull': [f'${attr}', []]},
+                                      'as': 'value',
+                                      'cond': {'$in': ['$$value', list(allowed)]}}}
+                pipeline.append({'$addFields': {attr: values}})
+
+            pipeline.append({'$unwind': {'path': f'${attr}', 'preserveNullAndEmptyArrays': True}})
+
+        group = {'_id': {attr: f'${attr}' for attr in group_by}, 'count': {'$sum': 1}}
+        group.update({field: {'$sum': f'${field}'} for field in sum_fields})
+        pipeline.append({'$group': group})
+        options = {'allowDiskUse': True}
+        if collation:
+            options['collation'] = collation
+
+        start_time = time.time()
+        results = []
+        for result in self.collection.aggregate(pipeline, **options):
+            row = {attr: result['_id'].get(attr) for attr in group_by}
+            row['count'] = result['count']
+            row.update({field: result[field] for field in sum_fields})
+            results.append(row)
+
+        self.logger.debug('Summarized %s groups of "%s" by %s in %.4fs',
+                          len(results),
+                          self.collection_name,
+                          ', '.join(group_by),
+                          time.time() - start_time)
+        return results
+
+    def get_generation(self):
+        """
+        Return change generation of this collection
+        Generation is increased by writers with bump_generation, so readers
+        can cheaply check whether their derived data is outdated
+        """
+        generation = self.client[Database.GENERATIONS_COLLECTION].find_one(
+            {'_id': self.collection_name})
+        return generation['generation'] if generation else 0
+
+    def get_generations(self, collection_names):
+        """
+        Return tuple of change generations of given collections
+        """
+        generations = self.client[Database.GENERATIONS_COLLECTION].find(
+            {'_id': {'$in': list(collection_names)}})
+        generations = {g['_id']: g['generation'] for g in generations}
+        return tuple(generations.get(name, 0) for name in collection_names)
+
+    def bump_generation(self):
+        """
+        Increase change generation of this collection and return the new value
+        """
+        generation = self.client[Database.GENERATIONS_COLLECTION].find_one_and_update(
+            {'_id': self.collection_name},
+            {'$inc': {'generation': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER)
+        return generation['generation']
+
+    @staticmethod
+    def get_projection(fields):
+        """
+        Return projection for list of fields, _id is included only if it is
+        in the list
+        """
+        if not fields:
+            return None
+
+        projection = {field: True for field in fields}
+        if '_id' not in projection:
+            projection['_id'] = False
+
+        return projection
+
+    def count(self, query_string=None, ignore_case=False, cached=False):
+        """
+        Return number of documents that match the query
+        Queries without a filter use collection metadata instead of counting
+        If cached is set, counts may be up to COUNT_CACHE_TIMEOUT seconds old
+        """
+        compiled_query = compile_query(query_string, ignore_case)
+        if compiled_query is None:
+            return 0
+
+        query_dict, collation = compiled_query
+        if not query_dict:
+            return self.collection.estimated_document_count()
+
+        cache_key = f'{Database.DATABASE_NAME}.{self.collection_name}:{ignore_case}:{query_string}'
+        if cached:
+            count = Database.count_cache.get(cache_key)
+            if count is not None:
+                return count
+
+        start_time = time.time()
+        if collation:
+            count = self.collection.count_documents(query_dict, collation=collation)
+        else:
+            count = self.collection.count_documents(query_dict)
+
+        self.log_slow_query({'filter': query_dict, 'collation': collation},
+                            time.time() - start_time,
+                            count)
+
+        Database.count_cache.set(cache_key, count, timeout=Database.COUNT_CACHE_TIMEOUT)
+        return count
@@ -0,0 +1,123 @@
+"""
+Module that contains background writer of history entries
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from utils.grasp_database import Database
+
+
+class HistoryWriter:
+    """
+    Writer that queues history entries and inserts them in a background
+    thread with a single insert_many when FLUSH_SIZE entries are queued or
+    the oldest one waited FLUSH_INTERVAL seconds
+    Queued entries are written before the process exits
+    """
+
+    FLUSH_SIZE = int(os.environ.get('HISTORY_FLUSH_SIZE', 100))
+    FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 2.0))
+    # Entries that do not fit in the queue are written by the caller
+    MAX_QUEUE_SIZE = 10000
+    # Queue and thread of the process that started them
+    queue = None
+    thread = None
+    pid = None
+    lock = threading.Lock()
+
+    @classmethod
+    def start(cls):
+        """
+        Start the background thread of this process if it is not running
+        """
+        with cls.lock:
+            if cls.pid == os.getpid() and cls.thread and cls.thread.is_alive():
+                return
+
+            if cls.pid is None:
+                atexit.register(cls.stop)
+
+            # Threads are not inherited by forked processes
+            cls.pid = os.getpid()
+            cls.queue = queue.Queue(maxsize=cls.MAX_QUEUE_SIZE)
+            cls.thread = threading.Thread(target=cls.run,
+                                          args=(cls.queue,),
+                                          name='history-writer',
+                                          daemon=True)
+            cls.thread.start()
+
+    @classmethod
+    def add(cls, entry):
+        """
+        Queue a history entry
+        """
+        if cls.pid != os.getpid() or not cls.thread or not cls.thread.is_alive():
+            cls.start()
+
+        try:
+            cls.queue.put_nowait(entry)
+        except queue.Full:
+            logging.getLogger().warning('History queue is full, writing entry directly')
+            cls.write([entry])
+
+    @classmethod
+    def run(cls, entries):
+        """
+        Collect entries from the queue and write them in batches until None
+        is received
+        """
+        running = True
+        while running:
+            entry = entries.get()
+            if entry is None:
+                break
+
+            batch = [entry]
+            deadline = time.time() + cls.FLUSH_INTERVAL
+            while len(batch) < cls.FLUSH_SIZE:
+                try:
+                    entry = entries.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+
+                if entry is None:
+                    running = False
+                    break
+
+                batch.append(entry)
+
+            cls.write(batch)
+
+    @staticmethod
+    def write(batch):
+        """
+        Insert a batch of entries to the history collection
+        """
+        logger = logging.getLogger()
+        try:
+            inserted = Database('history').bulk_insert(batch)
+            logger.debug('Wrote %s of %s history entries', inserted, len(batch))
+        except Exception as ex:
+            logger.error('Could not write %s history entries: %s', len(batch), ex)
+
+    @classmethod
+    def stop(cls, timeout=10):
+        """
+        Write all queued entries and stop the background thread
+        """
+        with cls.lock:
+            thread = cls.thread
+            if cls.pid != os.getpid() or not thread or not thread.is_alive():
+                return
+
+            try:
+                cls.queue.put(None, timeout=timeout)
+            except queue.Full:
+                logging.getLogger().error('Could not stop history writer, queue is full')
+                return
+
+            thread.join(timeout)
+            cls.thread = None
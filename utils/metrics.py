@@ -0,0 +1,168 @@
+"""
+Module that collects request metrics of this process and renders them in
+Prometheus text format
+"""
+import threading
+from flask import g, request
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values with their sum and count
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Add a value to the histogram
+        """
+        for index, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[index] += 1
+
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Request latency, response size and row count histograms by route,
+    method and status, and numbers of requests in flight by route and method
+    Metrics are kept per process
+    """
+
+    PREFIX = 'grasp'
+    DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (1000, 10000, 100000, 1000000, 10000000, 100000000)
+    ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+    lock = threading.Lock()
+    durations = {}
+    sizes = {}
+    rows = {}
+    in_flight = {}
+
+    @staticmethod
+    def get_route():
+        """
+        Return route of current request, e.g. /api/tags/delete/<string:tag>
+        """
+        return request.url_rule.rule if request.url_rule else request.path
+
+    @staticmethod
+    def set_rows(rows):
+        """
+        Set number of rows in response of current request
+        """
+        g.response_rows = rows
+
+    @staticmethod
+    def set_size(size):
+        """
+        Set uncompressed size of response body of current request
+        """
+        g.response_size = size
+
+    @classmethod
+    def start_request(cls, route, method):
+        """
+        Count a request in flight
+        """
+        with cls.lock:
+            cls.in_flight[(route, method)] = cls.in_flight.get((route, method), 0) + 1
+
+    @classmethod
+    def end_request(cls, route, method, status, duration, size=None, rows=None):
+        """
+        Count a finished request and observe its duration, size and rows
+        """
+        key = (route, method, str(status))
+        with cls.lock:
+            cls.in_flight[(route, method)] -= 1
+            cls.observe(cls.durations, key, duration, cls.DURATION_BUCKETS)
+            if size is not None:
+                cls.observe(cls.sizes, key, size, cls.SIZE_BUCKETS)
+
+            if rows is not None:
+                cls.observe(cls.rows, key, rows, cls.ROW_BUCKETS)
+
+    @staticmethod
+    def observe(histograms, key, value, buckets):
+        """
+        Add a value to histogram of the key
+        """
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            histograms[key] = histogram
+
+        histogram.observe(value)
+
+    @staticmethod
+    def format_labels(labels):
+        """
+        Return Prometheus labels of a dictionary
+        """
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        return '{%s}' % (','.join(f'{name}="{escape(value)}"' for name, value in labels.items()))
+
+    @classmethod
+    def format_histograms(cls, name, description, histograms):
+        """
+        Return lines of histograms in Prometheus text format
+        """
+        name = f'{cls.PREFIX}_{name}'
+        lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (route, method, status), histogram in sorted(histograms.items()):
+            labels = {'route': route, 'method': method, 'status': status}
+            for bucket, count in zip(histogram.buckets, histogram.counts):
+                bucket_labels = cls.format_labels(dict(labels, le=bucket))
+                lines.append(f'{name}_bucket{bucket_labels} {count}')
+
+            bucket_labels = cls.format_labels(dict(labels, le='+Inf'))
+            lines.append(f'{name}_bucket{bucket_labels} {histogram.count}')
+            labels = cls.format_labels(labels)
+            lines.append(f'{name}_sum{labels} {histogram.total}')
+            lines.append(f'{name}_count{labels} {histogram.count}')
+
+        return lines
+
+    @classmethod
+    def render(cls, gauges=None):
+        """
+        Return all metrics in Prometheus text format
+        Gauges is a dictionary of additional gauge names and (description,
+        value) tuples
+        """
+        with cls.lock:
+            lines = cls.format_histograms('request_duration_seconds',
+                                          'Time spent handling requests, streamed '
+                                          'requests end when the whole body was sent',
+                                          cls.durations)
+            lines += cls.format_histograms('response_size_bytes',
+                                           'Size of uncompressed response bodies, without '
+                                           'streamed responses',
+                                           cls.sizes)
+            lines += cls.format_histograms('response_rows',
+                                           'Number of rows in responses',
+                                           cls.rows)
+            name = f'{cls.PREFIX}_requests_in_flight'
+            lines += [f'# HELP {name} Number of requests being handled',
+                      f'# TYPE {name} gauge']
+            for (route, method), count in sorted(cls.in_flight.items()):
+                labels = cls.format_labels({'route': route, 'method': method})
+                lines.append(f'{name}{labels} {count}')
+
+        for gauge, (description, value) in sorted((gauges or {}).items()):
+            name = f'{cls.PREFIX}_{gauge}'
+            lines += [f'# HELP {name} {description}',
+                      f'# TYPE {name} gauge',
+                      f'{name} {value}']
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,247 @@
+"""
+Module that compiles query strings to MongoDB filters
+And operator is &&, or operator is ,
+Example prepid=*19*&&is_root=false
+"""
+import logging
+import re
+from functools import lru_cache
+from pymongo.collation import Collation
+
+
+# Number of different compiled query strings to keep
+QUERY_CACHE_SIZE = 1024
+# Collation used for case insensitive equality
+CASE_INSENSITIVE = Collation(locale='en', strength=2)
+# Characters that have special meaning in regex
+REGEX_SPECIAL = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def get_value_condition(value):
+    """
+    Get a condition from value and return value and condition separately
+    """
+    value_condition = None
+    if '<' in value[0]:
+        value_condition = '$lt'
+        value = value[1:]
+    elif value[0] == '>':
+        value_condition = '$gt'
+        value = value[1:]
+    elif value[0] == '!':
+        value_condition = '$ne'
+        value = value[1:]
+
+    return value, value_condition
+
+
+def get_typed_value(key, value):
+    """
+    Convert value to the type given in key
+    """
+    if '<int>' in key:
+        return int(value)
+
+    if '<float>' in key:
+        return float(value)
+
+    if '<bool>' in key:
+        return bool(value.lower() in ('true', 'yes'))
+
+    return value
+
+
+def get_wildcard_regex(value, ignore_case=False):
+    """
+    Return regex for a value with wildcards (already replaced with .*)
+    Case insensitive values are matched as a whole, so regex is anchored and
+    leading or trailing .* drop the anchor, e.g. ^abc.*$ -> ^abc
+    Case sensitive values are not anchored, so leading and trailing .* are
+    dropped, e.g. .*abc.* -> abc
+    """
+    if ignore_case:
+        pattern = f'^{value}$'
+        if pattern.endswith('.*$'):
+            pattern = pattern[:-3]
+
+        if pattern.startswith('^.*'):
+            pattern = pattern[3:]
+
+        return re.compile(pattern or '.*', re.IGNORECASE)
+
+    pattern = value
+    while pattern.startswith('.*.*'):
+        pattern = pattern[2:]
+
+    while pattern.endswith('.*.*'):
+        pattern = pattern[:-2]
+
+    if pattern != '.*':
+        pattern = pattern.removeprefix('.*').removesuffix('.*')
+
+    return pattern
+
+
+def has_wildcard(query_string):
+    """
+    Return whether query string (possibly None) has a wildcard, such queries
+    are matched case insensitively
+    """
+    return bool(query_string) and '*' in query_string
+
+
+def is_plain_value(value):
+    """
+    Return whether value has no characters that are special in regex
+    """
+    return REGEX_SPECIAL.search(value) is None
+
+
+def has_condition(key, values):
+    """
+    Return whether any of string values has <, > or ! condition
+    """
+    if '<int>' in key or '<float>' in key or '<bool>' in key:
+        return False
+
+    return any(get_value_condition(value.strip())[1] for value in values)
+
+
+def get_value_query(key, values, ignore_case=False, use_collation=False):
+    """
+    Check for < > and ! in front of values, handle OR operation, use correct attribute type
+    Values without conditions and wildcards are matched with a single $in
+    If ignore_case is set, plain string values rely on case insensitive
+    collation of the query if use_collation is set, otherwise they are
+    matched with case insensitive regexes
+    """
+    equal = []
+    value_or = []
+    is_string = '<int>' not in key and '<float>' not in key and '<bool>' not in key
+    attribute = key.replace('<int>', '').replace('<float>', '').replace('<bool>', '')
+    for value in values:
+        value, value_condition = get_value_condition(value.strip())
+        value = get_typed_value(key, value)
+        if value_condition:
+            value_or.append({attribute: {value_condition: value}})
+        elif is_string and '*' in value:
+            value_or.append({attribute: {'$regex': get_wildcard_regex(value, ignore_case)}})
+        elif is_string and ignore_case and not (use_collation and is_plain_value(value)):
+            value_or.append({attribute: re.compile(f'^{value}$', re.IGNORECASE)})
+        else:
+            equal.append(value)
+
+    if len(equal) == 1:
+        value_or.insert(0, {attribute: equal[0]})
+    elif equal:
+        value_or.insert(0, {attribute: {'$in': equal}})
+
+    if len(value_or) > 1:
+        return {'$or': value_or}
+
+    if len(value_or) == 1:
+        return value_or[0]
+
+    return None
+
+
+def split_query(query_string):
+    """
+    Return list of (key, values) parts of a query string with wildcards
+    replaced with .*
+    Return None if query can not match anything, e.g. "prepid="
+    """
+    parts = []
+    if query_string:
+        query_string_parts = [x for x in query_string.split('&&') if x.strip()]
+        for part in query_string_parts:
+            split_part = part.split('=')
+            key = split_part[0].strip()
+
+            values = split_part[1].strip().replace('**', '*').replace('*', '.*')
+            values = [value.strip() for value in values.split(',') if value.strip()]
+            if not values:
+                # If no value is given, then no results will be returned
+                # For example "prepid=" shou return nothing
+                return None
+
+            parts.append((key, values))
+
+    return parts
+
+
+def can_use_collation(query_string):
+    """
+    Return whether case insensitive collation can be used with a query
+    Collation would also make <, > and ! comparisons case insensitive
+    """
+    return not any(has_condition(k, v) for k, v in split_query(query_string) or [])
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(query_string, ignore_case=False):
+    """
+    Compile a query string to a MongoDB filter and collation
+    Return None if query can not match anything, e.g. "prepid="
+    Results are cached, so returned filters must not be modified
+    """
+    parts = split_query(query_string)
+    if parts is None:
+        return None
+
+    use_collation = ignore_case and can_use_collation(query_string)
+    query_dict = {'$and': []}
+    for key, values in parts:
+        value_query = get_value_query(key, values, ignore_case, use_collation)
+        if value_query:
+            query_dict['$and'].append(value_query)
+
+    if len(query_dict['$and']) == 1:
+        query_dict = query_dict['$and'][0]
+    elif not query_dict['$and']:
+        query_dict = {}
+
+    collation = None
+    if use_collation and needs_collation(query_dict):
+        collation = CASE_INSENSITIVE
+
+    logging.getLogger().debug('Compiled query %s to %s (collation %s)',
+                              query_string,
+                              query_dict,
+                              collation)
+    return query_dict, collation
+
+
+def needs_collation(query_dict):
+    """
+    Return whether filter has plain string equality that needs case
+    insensitive collation
+    """
+    if isinstance(query_dict, list):
+        return any(needs_collation(item) for item in query_dict)
+
+    if not isinstance(query_dict, dict):
+        return False
+
+    for key, value in query_dict.items():
+        if key in ('$and', '$or'):
+            if needs_collation(value):
+                return True
+        elif isinstance(value, str):
+            return True
+        elif isinstance(value, dict) and '$in' in value:
+            if any(isinstance(item, str) for item in value['$in']):
+                return True
+
+    return False
+
+
+def query_cache_info():
+    """
+    Return hits, misses and size of compiled query cache
+    """
+    info = compile_query.cache_info()
+    return {'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'max_size': info.maxsize}
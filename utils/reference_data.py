@@ -0,0 +1,81 @@
+"""
+Module that contains in-process cache of names in small reference
+collections, such as tags and campaigns
+"""
+import logging
+import os
+import threading
+import time
+from utils.grasp_database import Database
+
+
+class ReferenceData:
+    """
+    Cache of sorted names of objects in reference collections
+    Names are kept for TIMEOUT seconds, dropped when API of this process
+    changes the collection and when another process is seen to have changed
+    its change generation
+    """
+
+    TIMEOUT = int(os.environ.get('REFERENCE_CACHE_TIMEOUT', 60))
+    # Collection name -> (expiration time, generation, names, set of names)
+    entries = {}
+    # Collection name -> number of invalidations, to not store names that
+    # were read before an invalidation
+    invalidations = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def get_entry(cls, collection_name):
+        """
+        Return cached entry of collection, load it if needed
+        """
+        entry = cls.entries.get(collection_name)
+        if entry and entry[0] > time.time():
+            return entry
+
+        invalidations = cls.invalidations.get(collection_name, 0)
+        database = Database(collection_name)
+        generation = database.get_generation()
+        names = tuple(sorted(d['name'] for d in database.iterate(fields=['name'])))
+        entry = (time.time() + cls.TIMEOUT, generation, names, frozenset(names))
+        with cls.lock:
+            if cls.invalidations.get(collection_name, 0) == invalidations:
+                cls.entries[collection_name] = entry
+
+        logging.getLogger().debug('Loaded %s names of "%s"', len(names), collection_name)
+        return entry
+
+    @classmethod
+    def get_names(cls, collection_name):
+        """
+        Return sorted tuple of names in collection
+        """
+        return cls.get_entry(collection_name)[2]
+
+    @classmethod
+    def get_name_set(cls, collection_name):
+        """
+        Return frozenset of names in collection
+        """
+        return cls.get_entry(collection_name)[3]
+
+    @classmethod
+    def invalidate(cls, collection_name):
+        """
+        Drop cached names of collection
+        """
+        with cls.lock:
+            cls.invalidations[collection_name] = cls.invalidations.get(collection_name, 0) + 1
+            cls.entries.pop(collection_name, None)
+
+    @classmethod
+    def check_generations(cls, collection_names, generations):
+        """
+        Drop cached names of collections if they were read in a different
+        change generation
+        """
+        for collection_name, generation in zip(collection_names, generations):
+            entry = cls.entries.get(collection_name)
+            if entry and entry[1] != generation:
+                cls.invalidate(collection_name)
@@ -0,0 +1,118 @@
+"""
+Module that contains in-memory cache of serialized responses
+"""
+import gzip
+import logging
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Least recently used cache of serialized response bodies limited by their
+    total size in bytes
+    Bodies are stored together with their gzip compressed version
+    Entries belong to a generation (e.g. tuple of change generations of
+    collections that responses were made from) and all of them are dropped
+    when a newer generation is seen, generations only move forward, so
+    responses of older generations are not stored
+    """
+
+    # Compression level of stored bodies
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, max_size):
+        self.logger = logging.getLogger()
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.size = 0
+        self.generation = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self, generation=None):
+        """
+        Drop all entries and remember new generation
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def get(self, key, generation):
+        """
+        Return (body, compressed body, rows) tuple of the key or None if it is
+        not cached in given generation
+        """
+        with self.lock:
+            entry = self.entries.get(key) if generation == self.generation else None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, generation, body, rows=None):
+        """
+        Compress and store a body of given generation and its number of rows
+        Return (body, compressed body, rows) tuple even if it was not stored
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        entry = (body, gzip.compress(body, compresslevel=self.COMPRESS_LEVEL), rows)
+        entry_size = len(entry[0]) + len(entry[1])
+        # Single entry should not push out everything else
+        if entry_size > self.max_size // 4:
+            return entry
+
+        with self.lock:
+            if self.is_older(generation):
+                self.logger.debug('Not storing response of older generation %s than %s',
+                                  generation,
+                                  self.generation)
+                return entry
+
+            if generation != self.generation:
+                self.logger.debug('Response cache generation changed from %s to %s',
+                                  self.generation,
+                                  generation)
+                self.entries.clear()
+                self.size = 0
+                self.generation = generation
+
+            old_entry = self.entries.pop(key, None)
+            if old_entry:
+                self.size -= len(old_entry[0]) + len(old_entry[1])
+
+            self.entries[key] = entry
+            self.size += entry_size
+            while self.size > self.max_size:
+                _, old_entry = self.entries.popitem(last=False)
+                self.size -= len(old_entry[0]) + len(old_entry[1])
+
+        return entry
+
+    def is_older(self, generation):
+        """
+        Return whether generation is older than the current one in any of its
+        elements, i.e. it was read before some change that current one has seen
+        """
+        if self.generation is None:
+            return False
+
+        return any(new < old for new, old in zip(generation, self.generation))
+
+    def info(self):
+        """
+        Return hits, misses, number of entries and their size
+        """
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self.entries),
+                    'size': self.size,
+                    'max_size': self.max_size}
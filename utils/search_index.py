@@ -0,0 +1,162 @@
+"""
+Module that contains in-memory search index of dataset names
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from utils.grasp_database import Database
+
+
+class DatasetSearchIndex:
+    """
+    Trigram index of distinct dataset names in samples collection and
+    campaigns that these datasets are in
+    Index is rebuilt when change generation of samples collection changes
+    """
+
+    NGRAM_LENGTH = 3
+
+    def __init__(self, check_interval=30):
+        self.logger = logging.getLogger()
+        self.lock = threading.Lock()
+        # Seconds between checks of samples generation
+        self.check_interval = check_interval
+        self.checked = 0
+        self.generation = None
+        # Sorted dataset names, their campaigns and a dictionary of ngrams
+        # and sorted indices of datasets that contain them. Swapped all at once
+        self.state = ([], [], {})
+
+    @classmethod
+    def get_ngrams(cls, value):
+        """
+        Return set of all ngrams in a lowercase value
+        """
+        length = cls.NGRAM_LENGTH
+        return {value[i:i + length] for i in range(len(value) - length + 1)}
+
+    def build(self, combinations):
+        """
+        Build the index from dataset and campaign combinations
+        """
+        campaigns = {}
+        for combination in combinations:
+            dataset = combination.get('dataset')
+            if not dataset:
+                continue
+
+            campaigns.setdefault(dataset, set()).add(combination.get('campaign', ''))
+
+        datasets = sorted(campaigns)
+        ngrams = {}
+        for index, dataset in enumerate(datasets):
+            for ngram in self.get_ngrams(dataset.lower()):
+                ngrams.setdefault(ngram, []).append(index)
+
+        # Indices are added in ascending order
+        ngrams = {ngram: tuple(indices) for ngram, indices in ngrams.items()}
+        self.state = (datasets, [frozenset(campaigns[d]) for d in datasets], ngrams)
+        self.logger.info('Built dataset search index of %s datasets and %s ngrams',
+                         len(datasets),
+                         len(ngrams))
+
+    def refresh(self, force=False):
+        """
+        Rebuild the index if samples collection changed
+        Check is done at most once every check_interval seconds and only one
+        thread rebuilds the index while others keep using the old one
+        """
+        now = time.time()
+        if not force and self.is_fresh(now):
+            return
+
+        # Lock is released in finally below, "with" would always wait for it
+        # even when an old index can be used meanwhile
+        blocking = self.generation is None
+        if not self.lock.acquire(blocking): # pylint: disable=consider-using-with
+            return
+
+        try:
+            if not force and self.is_fresh(now):
+                return
+
+            self.checked = now
+            sample_db = Database('samples')
+            generation = sample_db.get_generation()
+            if not force and generation == self.generation:
+                return
+
+            self.build(sample_db.distinct_combinations(['dataset', 'campaign']))
+            self.generation = generation
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def contains(indices, index):
+        """
+        Return whether sorted indices contain the index
+        """
+        position = bisect_left(indices, index)
+        return position < len(indices) and indices[position] == index
+
+    def is_fresh(self, now):
+        """
+        Return whether index is built and generation was checked recently
+        """
+        return self.generation is not None and now - self.checked < self.check_interval
+
+    @staticmethod
+    def make_campaign_matcher(campaign):
+        """
+        Return a function that checks whether any of campaigns matches
+        comma separated list of campaign names with wildcards
+        """
+        patterns = [re.escape(c.strip()).replace('\\*', '.*') for c in campaign.split(',')]
+        pattern = re.compile('|'.join(f'(?:{p})' for p in patterns if p), re.IGNORECASE)
+        return lambda campaigns: any(pattern.fullmatch(c) for c in campaigns)
+
+    def search(self, query, campaign=None, limit=20):
+        """
+        Return sorted dataset names that contain parts of query separated by *
+        in the same order, ignoring case
+        If campaign is given, return only datasets in matching campaigns
+        """
+        self.refresh()
+        datasets, dataset_campaigns, ngrams = self.state
+        parts = [part.lower() for part in query.split('*') if part]
+        if not parts:
+            return []
+
+        postings = []
+        for ngram in set().union(*(self.get_ngrams(part) for part in parts)):
+            indices = ngrams.get(ngram)
+            if not indices:
+                return []
+
+            postings.append(indices)
+
+        # Candidates are datasets that contain the rarest ngram of the query
+        # and they are checked against other ngrams before the regex
+        # Parts that are too short for ngrams require checking all datasets
+        postings.sort(key=len)
+        candidates = postings.pop(0) if postings else range(len(datasets))
+        matcher = re.compile('.*'.join(re.escape(part) for part in parts), re.IGNORECASE)
+        campaign_matcher = self.make_campaign_matcher(campaign) if campaign else None
+        results = []
+        for index in candidates:
+            if not all(self.contains(indices, index) for indices in postings):
+                continue
+
+            if not matcher.search(datasets[index]):
+                continue
+
+            if campaign_matcher and not campaign_matcher(dataset_campaigns[index]):
+                continue
+
+            results.append(datasets[index])
+            if len(results) >= limit:
+                break
+
+        return results
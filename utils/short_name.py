@@ -0,0 +1,108 @@
+"""
+Module that classifies dataset names into short names
+Rules are read from a JSON file, see short_name_rules.json
+Each rule may have these conditions, all of which must be satisfied:
+  "first" - first part of dataset name before _ is equal to the value
+  "contains" - dataset name contains at least one of the values
+  "contains_all" - dataset name contains all of the values
+  "excludes" - dataset name contains none of the values
+"""
+import json
+import logging
+import os
+from functools import lru_cache
+
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'short_name_rules.json')
+# Number of different dataset names to remember
+SHORT_NAME_CACHE_SIZE = 8192
+
+
+def make_condition(rule):
+    """
+    Compile conditions of a rule to a function of dataset name and its first part
+    """
+    first = rule.get('first')
+    contains = tuple(rule.get('contains', []))
+    contains_all = tuple(rule.get('contains_all', []))
+    excludes = tuple(rule.get('excludes', []))
+
+    def condition(name, first_part):
+        """
+        Return whether dataset name satisfies the rule
+        """
+        if first is not None and first_part != first:
+            return False
+
+        if contains and not any(map(name.__contains__, contains)):
+            return False
+
+        if contains_all and not all(map(name.__contains__, contains_all)):
+            return False
+
+        return not excludes or not any(map(name.__contains__, excludes))
+
+    return condition
+
+
+def load_rules(filename):
+    """
+    Load rules from a JSON file and compile their conditions
+    """
+    with open(filename, encoding='utf-8') as rules_file:
+        rules = json.load(rules_file)
+
+    logging.getLogger().info('Loaded short name rules version %s from %s',
+                             rules.get('version'),
+                             filename)
+    return {'version': rules.get('version', 0),
+            'names': [(make_condition(r), r['name']) for r in rules.get('names', [])],
+            'generators': [(make_condition(r), r['suffix']) for r in rules.get('generators', [])],
+            'prefixes': [(r['prefix'], r['replacement']) for r in rules.get('prefixes', [])]}
+
+
+RULES = load_rules(os.environ.get('SHORT_NAME_RULES', RULES_FILE))
+
+
+def set_rules_file(filename):
+    """
+    Load rules from a different file and forget previous short names
+    """
+    global RULES #pylint: disable=global-statement
+    RULES = load_rules(filename)
+    get_short_name.cache_clear()
+
+
+def get_rules_version():
+    """
+    Return version of currently used rules
+    """
+    return RULES['version']
+
+
+@lru_cache(maxsize=SHORT_NAME_CACHE_SIZE)
+def get_short_name(name):
+    """
+    Return short name of dataset name
+    First matching name rule gives the name (default is first part of dataset
+    name), first matching generator rule adds a suffix and first matching
+    prefix is replaced
+    """
+    first_part = name.split('_')[0]
+    short_name = first_part
+    for condition, value in RULES['names']:
+        if condition(name, first_part):
+            short_name = value
+            break
+
+    for condition, suffix in RULES['generators']:
+        if condition(name, first_part):
+            short_name += suffix
+            break
+
+    for prefix, replacement in RULES['prefixes']:
+        if short_name.startswith(prefix):
+            short_name = short_name.replace(prefix, replacement, 1)
+            break
+
+    return short_name
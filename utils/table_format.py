@@ -0,0 +1,55 @@
+"""
+Module that converts lists of objects to compact table formats
+"""
+import csv
+import io
+
+
+def to_columns(rows, columns):
+    """
+    Return list of objects as column names and rows of values:
+    {"columns": [...], "rows": [[...], ...], "dictionaries": {...}}
+    String columns where values repeat at least twice on average are
+    dictionary encoded - their values are indices in sorted list of distinct
+    values in "dictionaries"
+    """
+    values = {column: [row.get(column) for row in rows] for column in columns}
+    dictionaries = {}
+    for column, column_values in values.items():
+        if not column_values or not all(isinstance(value, str) for value in column_values):
+            continue
+
+        distinct = sorted(set(column_values))
+        if len(distinct) * 2 > len(column_values):
+            continue
+
+        indices = {value: index for index, value in enumerate(distinct)}
+        values[column] = [indices[value] for value in column_values]
+        dictionaries[column] = distinct
+
+    return {'columns': list(columns),
+            'rows': [list(row) for row in zip(*(values[column] for column in columns))],
+            'dictionaries': dictionaries}
+
+
+def to_csv(rows, columns):
+    """
+    Return list of objects as CSV with a header, list values are joined with commas
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row.get(column)
+            if value is None:
+                value = ''
+            elif isinstance(value, list):
+                value = ','.join(str(item) for item in value)
+
+            values.append(value)
+
+        writer.writerow(values)
+
+    return output.getvalue()
@@ -4,8 +4,13 @@ Module that contains all utility functions
 import os
 import re
 import inspect
+from utils.short_name import get_short_name, get_rules_version
 
 
+# Version of rules in add_derived_fields, increase it when the rules change so
+# that stored derived fields are recomputed
+DERIVED_FIELDS_VERSION = 1
+
 def make_regex_matcher(pattern):
     """
     Compile a regex pattern and return a function that performs fullmatch on
@@ -28,6 +33,22 @@ def clean_split(string, separator=',', maxsplit=-1):
     return [x.strip() for x in string.split(separator, maxsplit) if x.strip()]
 
 
+def parse_limit(value, default, maximum):
+    """
+    Return page size given as a string, clamped to 1..maximum
+    Raise ValueError if it is not an integer
+    """
+    if value is None:
+        return default
+
+    try:
+        limit = int(value)
+    except ValueError as ex:
+        raise ValueError(f'Invalid limit "{value}", it must be an integer') from ex
+
+    return min(max(limit, 1), maximum)
+
+
 def strip_doc(doc):
     """
     LStrip docstring according to number of spaces in the first line
@@ -122,3 +143,69 @@ def chained_request_to_steps(chained_request):
             steps['dr'] = req_prepid
 
     return steps
+
+
+def get_chain_tag(name):
+    """
+    Get chain tag out of chained request name
+    If there is something after DIGI, use that something
+    Else it is Classical
+    """
+    if name == '':
+        return ''
+
+    tag = ''
+    try:
+        if 'DIGI' in name:
+            tag = name.split('-')[1].split('DIGI')[1].split('_')[0]
+        elif 'DR' in name:
+            tag = name.split('-')[1].split('DR')[1].split('_')[0]
+
+        if tag:
+            return tag
+
+    except IndexError:
+        pass
+
+    return 'Classical'
+
+
+def get_xaod_version(prepid):
+    """
+    Return version of MiniAOD or NanoAOD of request
+    """
+    if not prepid:
+        return ''
+
+    prepid = prepid.lower()
+    if 'aod' in prepid:
+        # Remove v or APVv
+        version = prepid.split('aod')[-1].lstrip('apv')
+        version = version.replace(version.lstrip('0123456789'), '')
+        if version != '':
+            return f'v{version}'
+
+        return 'v1'
+
+    return ''
+
+
+def get_derived_version():
+    """
+    Return version of derived fields, it changes when either code or short
+    name rules change
+    """
+    return f'{DERIVED_FIELDS_VERSION}.{get_rules_version()}'
+
+
+def add_derived_fields(sample):
+    """
+    Compute attributes that are derived from other sample attributes and
+    store them together with their version in the sample
+    """
+    sample['short_name'] = get_short_name(sample['dataset'])
+    sample['chain_tag'] = get_chain_tag(sample['chained_request'])
+    sample['miniaod_version'] = get_xaod_version(sample['miniaod'])
+    sample['nanoaod_version'] = get_xaod_version(sample['nanoaod'])
+    sample['derived_version'] = get_derived_version()
+    return sample